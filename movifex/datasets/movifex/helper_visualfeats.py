@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 
-from movifex.utils import loadJsonFromUrl
+import io
+from movifex.utils import loadJsonFromUrl, loadBytesFromUrl
+from movifex.pipelines.visual_features.packets import readBinaryPacket, packetToRecords
 
-def packetAddressGenerator(datasetUrl: str, gFeature: str, gModel: str, gMovieId, gPacketId):
+def packetAddressGenerator(datasetUrl: str, gFeature: str, gModel: str, gMovieId, gPacketId, packetFormat: str = "json"):
   """
   Generates the address of a packet file based on the given parameters.
 
@@ -12,6 +14,7 @@ def packetAddressGenerator(datasetUrl: str, gFeature: str, gModel: str, gMovieId
       gModel (str): The model used for feature extraction.
       gMovieId (int): The ID of the movie.
       gPacketId (int): The ID of the packet.
+      packetFormat (str): The format of the packet files ("json" or "npz").
 
   Returns:
       packetAddress (str): The URL address of the
@@ -20,10 +23,29 @@ def packetAddressGenerator(datasetUrl: str, gFeature: str, gModel: str, gMovieId
   gMovieId = f"{int(gMovieId):010d}"
   gPacketId = str(gPacketId).zfill(4)
   # Create address
-  packetAddress = datasetUrl + f"{gFeature}/{gModel}/{gMovieId}/packet" + str(gPacketId).zfill(4) + ".json"
+  packetAddress = datasetUrl + f"{gFeature}/{gModel}/{gMovieId}/packet" + str(gPacketId).zfill(4) + f".{packetFormat}"
   return packetAddress
 
-def fetchAllPackets(datasetUrl: str, gFeature: str, gModel: str, gMovieId):
+def fetchPacket(packetAddress: str, packetFormat: str = "json"):
+  """
+  Fetches a packet from the dataset as a list of {frameId, features} records, whatever its format is.
+
+  Parameters:
+      packetAddress (str): The URL address of the packet.
+      packetFormat (str): The format of the packet file ("json" or "npz").
+
+  Returns:
+      packetData (list): The records of the packet (None if it cannot be fetched).
+  """
+  if packetFormat == "npz":
+    packetContent = loadBytesFromUrl(packetAddress)
+    if not packetContent:
+      return None
+    frameIds, features, header = readBinaryPacket(io.BytesIO(packetContent))
+    return packetToRecords(frameIds, features, header['represents'])
+  return loadJsonFromUrl(packetAddress)
+
+def fetchAllPackets(datasetUrl: str, gFeature: str, gModel: str, gMovieId, packetFormat: str = "json"):
   """
   Fetches all packets of a movie from the dataset.
 
@@ -32,6 +54,7 @@ def fetchAllPackets(datasetUrl: str, gFeature: str, gModel: str, gMovieId):
       gFeature (str): The feature type (e.g., "audio", "visual").
       gModel (str): The model used for feature extraction.
       gMovieId (int): The ID of the movie.
+      packetFormat (str): The format of the packet files ("json" or "npz").
 
   Returns:
       moviePackets (list): A list of all packets of the movie.  
@@ -43,15 +66,15 @@ def fetchAllPackets(datasetUrl: str, gFeature: str, gModel: str, gMovieId):
   while True:
     counter += 1
     # Generate packet address
-    packetAddress = packetAddressGenerator(datasetUrl, gFeature, gModel, gMovieId, counter)
+    packetAddress = packetAddressGenerator(datasetUrl, gFeature, gModel, gMovieId, counter, packetFormat)
     print(f'Generated packet address: {packetAddress}')
-    # Fetch JSON data
-    jsonData = loadJsonFromUrl(packetAddress)
-    if jsonData:
-      print(f'Fetched JSON from the address ...')
-      moviePackets += jsonData
+    # Fetch packet data
+    packetData = fetchPacket(packetAddress, packetFormat)
+    if packetData:
+      print(f'Fetched packet data from the address ...')
+      moviePackets += packetData
     else:
-      print(f'No JSON data found at the address ...')
+      print(f'No packet data found at the address ...')
       break
   # Return
   return moviePackets
\ No newline at end of file
@@ -70,6 +70,7 @@ def testMoViFexEmbeddings(configs: dict):
     featureModels = configs['feature_models']
     featureSources = configs['feature_sources']
     aggFeatureSources = configs['agg_feature_sources']
+    packetFormat = configs.get('packet_format', 'json')
     # Other variables
     givenMovieId = 6
     givenModel = featureModels[0]
@@ -78,11 +79,11 @@ def testMoViFexEmbeddings(configs: dict):
     print(f"Running the visual dataset functions of '{datasetName}' embedding processing ...")
     # Pre-check fetch addresses of files
     print(f"\n- Generating a sample packet address file from '{datasetRawFilesUrl}' ...")
-    packetAddress = packetAddressGenerator(datasetRawFilesUrl, givenFeatureSource, givenModel, givenMovieId, 1)
+    packetAddress = packetAddressGenerator(datasetRawFilesUrl, givenFeatureSource, givenModel, givenMovieId, 1, packetFormat)
     print(f"- Generated address (str): {packetAddress}")
     # Fetch all packets of a movie
     print(f"\n- Fetching all packets of the movie #{givenMovieId}) ...")
-    moviePackets = fetchAllPackets(datasetRawFilesUrl, givenFeatureSource, givenModel, givenMovieId)
+    moviePackets = fetchAllPackets(datasetRawFilesUrl, givenFeatureSource, givenModel, givenMovieId, packetFormat)
     print(f"- Number of fetched packets (list): {len(moviePackets)}")
     # Fetch all aggregated features of a given movie
     print(f"\n- Fetching aggregated features of the movie #{givenMovieId} ({givenModel}, {givenAggFeatureSource}) ...")
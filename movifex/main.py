@@ -4,9 +4,10 @@ from movifex.utils import readConfigs
 from movifex.pipelines.downloaders.utils import videoFileDownloader
 from movifex.multimodal.fused.overlap_checker import runVisualTextualDatasetsOverlapChecker
 from movifex.datasets.runDataset import testMoViFexMetadata, testMoViFexEmbeddings, testMovieLens25M
-from movifex.runCore import runShotDetectionFromFrames, runShotDetectionFromFeatures, runAggFeatures
+from movifex.runCore import runShotDetectionFromFrames, runShotDetectionFromFeatures, runAggFeatures, runPacketConverter
+from movifex.runCore import runFeatureWorker, runFeatureJobSubmitter, runShotThresholdSweep
 from movifex.multimodal.fused.fuse_visual_textual import fuseTextualWithMMTF, fuseTextualWithSceneSense
-from movifex.runCore import runTrailerDownloader, runMoviesFrameExtractor, runMoviesFramesFeatureExtractor
+from movifex.runCore import runTrailerDownloader, runMoviesFrameExtractor, runMoviesFramesFeatureExtractor, runMoviesVideoFeatureExtractor
 
 def main():
     print("Welcome! Starting 'MoViFex'!\n")
@@ -41,15 +42,32 @@ def main():
         elif (subMode == 'feat_extractor'):
             # Run the movies features extractor pipeline
             runMoviesFramesFeatureExtractor(cfgPipeline['movie_frames_visual_features'])
+        elif (subMode == 'video_feat_extractor'):
+            # Run the single-pass features extractor pipeline from the movie videos (frames are not saved)
+            runMoviesVideoFeatureExtractor(cfgPipeline['movie_videos_visual_features'])
         elif (subMode == 'shot_from_feat'):
             # Run the shot detection pipeline from the extracted features
             runShotDetectionFromFeatures(cfgPipeline['movie_shots']['variants']['from_features'])
+        elif (subMode == 'shot_sweep'):
+            # Report the number of shots per threshold, from the cached similarities of the extracted features
+            runShotThresholdSweep(cfgPipeline['movie_shots']['variants']['from_features'])
         elif (subMode == 'shot_from_frame'):
             # Run the shot detection pipeline from the extracted frames
             runShotDetectionFromFrames(cfgPipeline['movie_shots']['variants']['from_frames'])
         elif (subMode == 'agg_features'):
             # Run the feature aggregation pipeline
             runAggFeatures(cfgPipeline['feature_aggregation'])
+        elif (subMode == 'convert_packets'):
+            # Run the converter of the JSON feature packets into binary packets
+            runPacketConverter(cfgPipeline['feature_packets_converter'])
+        elif (subMode == 'feat_worker'):
+            # Run the feature extraction worker, keeping the models loaded for the submitted jobs
+            runFeatureWorker(cfgPipeline['feature_extraction_worker'], cfgPipeline['movie_frames_visual_features'],
+                             cfgPipeline['movie_videos_visual_features'])
+        elif (subMode == 'feat_submit'):
+            # Submit a feature extraction job to the running worker
+            runFeatureJobSubmitter(cfgPipeline['feature_extraction_worker'], cfgPipeline['movie_frames_visual_features'],
+                                   cfgPipeline['movie_videos_visual_features'])
         else:
             print(f"Unsupported sub-mode '{subMode}' selected! Exiting ...")
     elif (mode == 'ds'):
@@ -1,7 +1,16 @@
 import os
 import time
 import cv2 as cv
-from movifex.pipelines.frames.utils import initFramesFolder, resizeFrame
+from multiprocessing import current_process
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from movifex.pipelines.frames.frameWriter import saveFrame, startFrameWriters, stopFrameWriters, checkSavedFrames, formatTimings, FrameShardWriter, discardUncommittedShardFrames
+from movifex.pipelines.frames.frameManifest import loadFramesManifest, saveFramesManifest, finalizeFramesManifest, getManifestParameters, loadSegmentCheckpoint, saveSegmentCheckpoint
+from movifex.pipelines.frames.utils import initFramesFolder, resizeFrame, sampleVideoFrames, getFramePickingRate, splitVideoIntoSegments
+from movifex.pipelines.frames.utils import computeFrameSignature, isNearDuplicateFrame
+from movifex.pipelines.shots.utils import computeShotSignature, isShotBoundary
+
+# Maximum number of samples before a segment searched for the (textured) sample seeding its online shot detection
+SHOT_SEED_SAMPLES = 10
 
 def extractMovieFrames(configs: dict, fetchedMoviesPaths: list):
     """
@@ -15,63 +24,290 @@ def extractMovieFrames(configs: dict, fetchedMoviesPaths: list):
         The list of fetched movie paths
     """
     print("Extracting frames from the given set of movie videos ...")
-    # Iterate on all video files in the given directory
+    # Check the sampling mode
+    samplingMode = configs.get('sampling_mode', 'grab')
+    if samplingMode not in ['read', 'grab', 'seek']:
+        print(f"Sampling mode '{samplingMode}' is not supported! Exiting ...")
+        return
+    # Check the frames container
+    framesContainer = configs.get('frames_container', 'files')
+    if framesContainer not in ['files', 'shards']:
+        print(f"Frames container '{framesContainer}' is not supported! Exiting ...")
+        return
+    # Variables
+    startTime = time.time()
+    movieManifests = {}
+    extractionJobs = []
+    numWorkers = configs.get('num_workers', 0) or os.cpu_count()
+    numSegments = configs.get('video_segments', 1)
+    # Preparing the output frames directories (movies with an existing output folder are skipped)
     for videoFile in fetchedMoviesPaths:
-        # Preparing the output frames directory
         outputDir = initFramesFolder(videoFile, configs['frames_path'])
         if not outputDir:
             continue
-        # Capturing video
+        # Resume an interrupted extraction with the segments of its manifest, or start a new one
+        manifest = loadFramesManifest(outputDir)
+        if manifest is None:
+            # Split the video into time ranges to be extracted separately (a single range if not requested)
+            segments = splitVideoIntoSegments(videoFile, configs['frequency'], numSegments)
+            manifest = {'video': videoFile, 'parameters': getManifestParameters(configs),
+                        'segments': [list(segment) for segment in segments], 'completed': False}
+            saveFramesManifest(outputDir, manifest)
+        elif manifest['parameters'] != getManifestParameters(configs):
+            print(f"- Skipping {os.path.basename(outputDir)}, as its interrupted extraction used different parameters "
+                  f"({manifest['parameters']})! Remove its output folder to start over.")
+            continue
+        movieManifests[outputDir] = manifest
+        for startSample, endSample, duration in manifest['segments']:
+            extractionJobs.append((duration, videoFile, outputDir, startSample, endSample))
+    if not extractionJobs:
+        print("No movie videos left to extract frames from! Exiting ...")
+        return
+    # Schedule the longest videos (segments) first, so that a single long movie does not hold up the whole run
+    extractionJobs.sort(key=lambda job: job[0], reverse=True)
+    # Run sequentially if only one worker is needed
+    numWorkers = min(numWorkers, len(extractionJobs))
+    if numWorkers == 1:
+        totalFrames = sum(extractVideoFrames(videoFile, outputDir, configs, startSample, endSample)
+                          for _, videoFile, outputDir, startSample, endSample in extractionJobs)
+    else:
+        # Otherwise, distribute the movies (segments) over a pool of worker processes
+        totalFrames = 0
+        print(f"- Distributing {len(extractionJobs)} extraction jobs of {len(movieManifests)} movies over {numWorkers} worker processes ...\n")
+        with ProcessPoolExecutor(max_workers=numWorkers, initializer=initFrameExtractorWorker) as executor:
+            futures = {executor.submit(extractVideoFrames, videoFile, outputDir, configs, startSample, endSample): videoFile
+                       for _, videoFile, outputDir, startSample, endSample in extractionJobs}
+            for future in as_completed(futures):
+                try:
+                    totalFrames += future.result()
+                except Exception as workerError:
+                    print(f'Error while processing video frames of "{futures[future]}": {str(workerError)}')
+    # Mark the movies with all segments completed as completed
+    for outputDir, manifest in movieManifests.items():
+        if not finalizeFramesManifest(outputDir, manifest):
+            print(f'- The extraction of {os.path.basename(outputDir)} is not completed! Run the pipeline again to resume it.')
+        elif configs.get('dedup_threshold', 0) > 0:
+            # Report the ratio of the dropped near-duplicate frames of the movie
+            numDropped, numFrames = len(manifest['duplicates']), manifest['lastCommittedFrame'] + 1
+            dedupRatio = numDropped / numFrames if numFrames > 0 else 0
+            print(f'- {os.path.basename(outputDir)}: dropped {numDropped} near-duplicate frames out of {numFrames} (dedup ratio: {dedupRatio:.2%})')
+    # Inform the user about the whole extraction process
+    elapsedTime = '{:.2f}'.format(time.time() - startTime)
+    print(f'- Extracted {totalFrames} frames from {len(movieManifests)} movies using {numWorkers} worker(s) in {elapsedTime} seconds!')
+
+def initFrameExtractorWorker():
+    """
+    Initializes a frame extractor worker process, preventing OpenCV from oversubscribing the CPU cores
+    """
+    cv.setNumThreads(1)
+
+def extractVideoFrames(videoFile: str, outputDir: str, configs: dict, startSample: int = 0, endSample: int = None):
+    """
+    Extracts frames from a single movie video (or a time range of it) into its output frames directory
+
+    Parameters
+    ----------
+    videoFile :str
+        The movie video file address
+    outputDir :str
+        The output frames directory of the movie
+    configs :dict
+        The configurations dictionary
+    startSample :int
+        The global index of the first sampled frame to extract (used for the frame file names)
+    endSample :int
+        The global index of the sampled frame to stop at (exclusive), or None to extract until the end of the video
+
+    Returns
+    -------
+    frameCounter :int
+        The number of extracted frames
+    """
+    # Variables
+    startTime = time.time()
+    frequency = configs['frequency']
+    videoName = os.path.basename(outputDir)
+    savedFrameFormat = configs['output_format']
+    modelInputSize = configs['model_input_size']
+    samplingMode = configs.get('sampling_mode', 'grab')
+    checkpointInterval = max(configs.get('checkpoint_interval', 100), 1)
+    dedupThreshold = configs.get('dedup_threshold', 0)
+    timings = {'decode': 0.0, 'dedup': 0.0, 'shots': 0.0, 'resize': 0.0, 'queue': 0.0, 'encode': 0.0, 'write': 0.0}
+    # Near-duplicate frames are dropped, while recording the kept frame they duplicate
+    duplicateFrames = {}
+    keptFrameId, keptSignature = None, None
+    # Shot boundaries are detected while decoding, saving the first frame of each shot in its shot frames directory (if requested)
+    onlineShots = configs.get('online_shots', False)
+    keyframesOnly = onlineShots and configs.get('shot_keyframes_only', False)
+    shotThreshold = configs.get('shot_threshold', 0.65)
+    shotSignatureSize = configs.get('shot_signature_size', 32)
+    shotSignature, shotCounter = None, 0
+    segmentInfo = f' (frames #{startSample} to #{endSample if endSample is not None else "end"})' if (startSample > 0 or endSample is not None) else ''
+    # Tag the logs with the worker name when running in a worker process
+    workerName = current_process().name
+    logPrefix = f'[{workerName}] ' if workerName != 'MainProcess' else ''
+    # Resume from the last committed frame of the segment (if a previous run was interrupted)
+    resumeSample = startSample
+    checkpoint = loadSegmentCheckpoint(outputDir, startSample)
+    if checkpoint is not None:
+        if checkpoint.get('completed', False):
+            print(f'{logPrefix}- Skipping {videoName}{segmentInfo}, as its extraction is already completed!')
+            return 0
+        resumeSample = checkpoint['lastCommittedFrame'] + 1
+        duplicateFrames = checkpoint.get('duplicates', {})
+        print(f'{logPrefix}- Resuming {videoName}{segmentInfo} from frame #{resumeSample} ...')
+    frameCounter = resumeSample
+    # Start a few samples earlier to seed the shot detection with the last textured sample before the segment (if the
+    # segment does not start the movie), so that the detected shots do not depend on where the segments start
+    seedSample = max(resumeSample - SHOT_SEED_SAMPLES, 0) if onlineShots else resumeSample
+    if onlineShots:
+        shotsDir = os.path.join(configs['shot_frames_path'], videoName)
+        os.makedirs(shotsDir, exist_ok=True)
+    # Capturing video
+    try:
+        # Extract frames from the video
+        capturedVideo = cv.VideoCapture(videoFile)
+        # Get the frame rate and the distance between the frames to pick
+        frameRate, frequency, framePickingRate = getFramePickingRate(capturedVideo, frequency)
+        # Start extracting frames
+        print(f'{logPrefix}- Extracting frames of {videoName}{segmentInfo} with the frequency of {frequency} fps ...')
+        print(f'{logPrefix}--- Frame rate: {frameRate} fps, Frequency: {frequency} fps, Frame picking rate: {framePickingRate}, Sampling mode: {samplingMode}')
+        # Pack the frames into shards instead of separate files (if requested)
+        shardWriter = None
+        if configs.get('frames_container', 'files') == 'shards':
+            # Drop the frames appended after the last checkpoint of an interrupted run
+            discardUncommittedShardFrames(outputDir, startSample, endSample, resumeSample)
+            shardWriter = FrameShardWriter(outputDir, configs.get('shard_size', 1000))
+        # Start the frame writers, encoding and saving frames while decoding continues (if requested)
+        framesQueue, frameWriters, writerTimings, failedFrames = startFrameWriters(configs.get('writer_threads', 0), configs.get('writer_queue_size', 32),
+                                                                                   outputDir, savedFrameFormat, shardWriter)
         try:
-            # Variables
-            frameIndex = 0
-            frameCounter = 0
-            frameIndexToPick = 0
-            startTime = time.time()
-            frequency = configs['frequency']
-            videoName = os.path.basename(outputDir)
-            savedFrameFormat = configs['output_format']
-            modelInputSize = configs['model_input_size']
-            # Extract frames from the video
-            capturedVideo = cv.VideoCapture(videoFile)
-            # Get the frame rate and compare it with the given frame rate
-            frameRate = int(capturedVideo.get(cv.CAP_PROP_FPS))
-            if frequency > frameRate:
-                frequency = frameRate
-            # Start extracting frames
-            print(f'- Extracting frames of {videoName} with the frequency of {frequency} fps ...')
-            # Set a frame to pick
-            framePickingRate = int(frameRate / frequency)
-            print(f'--- Frame rate: {frameRate} fps, Frequency: {frequency} fps, Frame picking rate: {framePickingRate}')
-            while True:
-                success, frame = capturedVideo.read()
-                # If the end of the video is reached
-                if not success:
-                    # Finished extracting frames
-                    elapsedTime = '{:.2f}'.format(time.time() - startTime)
-                    print(f'- Extraction finished for {videoName} (took {elapsedTime} seconds to extract {frameCounter} frames, saved in {outputDir})!\n')
+            # Only the sampled frames are decoded and handed over
+            stepTime = time.perf_counter()
+            for frameIndex, frame in sampleVideoFrames(capturedVideo, framePickingRate, samplingMode, seedSample * framePickingRate):
+                timings['decode'] += time.perf_counter() - stepTime
+                # Only keep the signature of the seed samples (they belong to the previous segment, or are already extracted),
+                # skipping the ones without texture as the shot detection does
+                if seedSample < resumeSample:
+                    seedSignature = computeShotSignature(frame, shotSignatureSize)
+                    if seedSignature is not None:
+                        shotSignature = seedSignature
+                    seedSample += 1
+                    stepTime = time.perf_counter()
+                    continue
+                # Stop if the end of the given time range is reached
+                if endSample is not None and frameCounter >= endSample:
                     break
-                # Otherwise, continue extracting frames
-                # Pick only the frames with the given frequency
-                if (frameIndex == frameIndexToPick):
-                    # Save frame file name as: frame1 --> frame0000001
-                    fileName = '{0:07d}'.format(frameCounter)
-                    # Showing progress every 1000 frames
-                    if (frameCounter > 0 and frameCounter % 100 == 0):
-                        elapsedTime = '{:.2f}'.format(time.time() - startTime)
-                        print(
-                            f'--- Processing frame #{frameIndex} of the video (took {elapsedTime} seconds to extract {frameCounter} frames so far) ...')
+                # Save frame file name as: frame1 --> frame0000001
+                frameId = 'frame{0:07d}'.format(frameCounter)
+                # Showing progress every 100 frames
+                if (frameCounter > resumeSample and frameCounter % 100 == 0):
+                    elapsedTime = '{:.2f}'.format(time.time() - startTime)
+                    print(
+                        f'{logPrefix}--- Processing frame #{frameIndex} of {videoName} (took {elapsedTime} seconds to extract {frameCounter - resumeSample} frames so far) ...')
+                # Check whether the frame starts a new shot, comparing it with the previous sample (if requested)
+                isKeyframe = False
+                if onlineShots:
+                    stepTime = time.perf_counter()
+                    currShotSignature = computeShotSignature(frame, shotSignatureSize)
+                    # Frames without texture (e.g., black frames of fades) are not compared
+                    if currShotSignature is not None:
+                        isKeyframe = isShotBoundary(shotSignature, currShotSignature, shotThreshold)
+                        shotSignature = currShotSignature
+                    timings['shots'] += time.perf_counter() - stepTime
+                # Drop the frame if it is nearly identical to the previous kept frame (if requested)
+                isDuplicate = False
+                if dedupThreshold > 0:
+                    stepTime = time.perf_counter()
+                    signature = computeFrameSignature(frame)
+                    isDuplicate = isNearDuplicateFrame(keptSignature, signature, dedupThreshold)
+                    if isDuplicate:
+                        duplicateFrames[frameId] = keptFrameId
+                    else:
+                        keptFrameId, keptSignature = frameId, signature
+                    timings['dedup'] += time.perf_counter() - stepTime
+                if isKeyframe or (not isDuplicate and not keyframesOnly):
                     # Resizing the image, while preserving its aspect-ratio
+                    stepTime = time.perf_counter()
                     pFrame = resizeFrame(frame, modelInputSize)
-                    # Save the frame as a file
-                    cv.imwrite(
-                        f"{outputDir}/frame{fileName}.{savedFrameFormat}", pFrame)
-                    # Increment the frame counter and set the next frame to pick
-                    frameCounter += 1
-                    frameIndexToPick += framePickingRate
-                # Increment the frame index
-                frameIndex += 1
-        except cv.error as openCVError:
-            print(f'Error while processing video frames: {str(openCVError)}')
-        except Exception as otherError:
-            print(f'Error while processing video frames: {str(otherError)}')
\ No newline at end of file
+                    timings['resize'] += time.perf_counter() - stepTime
+                # Save the shot keyframe in the shot frames directory
+                if isKeyframe:
+                    saveFrame(pFrame, frameId, shotsDir, savedFrameFormat, timings)
+                    shotCounter += 1
+                if not isDuplicate and not keyframesOnly:
+                    # Save the frame as a file (or hand it over to the writers, waiting if their queue is full)
+                    if framesQueue is None:
+                        saveFrame(pFrame, frameId, outputDir, savedFrameFormat, timings, shardWriter)
+                    else:
+                        stepTime = time.perf_counter()
+                        framesQueue.put((pFrame, frameId))
+                        timings['queue'] += time.perf_counter() - stepTime
+                # Increment the frame counter
+                frameCounter += 1
+                # Commit the saved frames every 'checkpointInterval' frames
+                if (frameCounter - resumeSample) % checkpointInterval == 0:
+                    commitExtractedFrames(outputDir, startSample, frameCounter - 1, framesQueue, shardWriter, duplicateFrames, failedFrames)
+                stepTime = time.perf_counter()
+        finally:
+            # Wait for the pending frames to be saved
+            stopFrameWriters(framesQueue, frameWriters)
+            if shardWriter is not None:
+                shardWriter.close()
+        # Mark the segment as completed (only if the writers saved all of its frames)
+        checkSavedFrames(failedFrames)
+        saveSegmentCheckpoint(outputDir, startSample, frameCounter - 1, completed=True, duplicates=duplicateFrames)
+        # Finished extracting frames
+        capturedVideo.release()
+        elapsedTime = '{:.2f}'.format(time.time() - startTime)
+        print(f'{logPrefix}- Extraction finished for {videoName}{segmentInfo} (took {elapsedTime} seconds to extract {frameCounter - resumeSample} frames, saved in {outputDir})!')
+        if dedupThreshold > 0:
+            print(f'{logPrefix}--- Dropped {len(duplicateFrames)} near-duplicate frames of {videoName}{segmentInfo}')
+        if onlineShots:
+            print(f'{logPrefix}--- Detected {shotCounter} shots of {videoName}{segmentInfo}, keyframes saved in {shotsDir}')
+        # Report the time spent on each step (the writers' time is summed over all writer threads)
+        for writerTiming in writerTimings:
+            timings['encode'] += writerTiming['encode']
+            timings['write'] += writerTiming['write']
+        print(f'{logPrefix}--- Time breakdown: {formatTimings(timings)}\n')
+    except cv.error as openCVError:
+        print(f'{logPrefix}Error while processing video frames: {str(openCVError)}')
+    except Exception as otherError:
+        print(f'{logPrefix}Error while processing video frames: {str(otherError)}')
+    # Return the number of extracted frames
+    return frameCounter - resumeSample
+
+def commitExtractedFrames(outputDir: str, startSample: int, lastFrame: int, framesQueue, shardWriter, duplicateFrames: dict,
+                          failedFrames: list = None):
+    """
+    Waits for the given frames to be completely saved and records them in the checkpoint of their segment (the checkpoint
+    is not advanced if a writer could not save any of them, so that a resumed run extracts them again)
+
+    Parameters
+    ----------
+    outputDir :str
+        The output frames directory of the movie
+    startSample :int
+        The global index of the first sampled frame of the segment
+    lastFrame :int
+        The global index of the last frame handed over to be saved
+    framesQueue :queue.Queue
+        The queue of the frame writers (None if the frames are saved inline)
+    shardWriter :FrameShardWriter
+        The shard writer of the segment (None if the frames are saved as separate files)
+    duplicateFrames :dict
+        The mapping of the dropped near-duplicate frames to the kept frames they duplicate
+    failedFrames :list
+        The identifiers of the frames the writers could not save
+
+    Raises
+    ------
+    OSError
+        If a writer could not save a frame
+    """
+    if framesQueue is not None:
+        framesQueue.join()
+    checkSavedFrames(failedFrames or [])
+    if shardWriter is not None:
+        shardWriter.flush()
+    saveSegmentCheckpoint(outputDir, startSample, lastFrame, duplicates=duplicateFrames)
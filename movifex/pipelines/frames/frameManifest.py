@@ -0,0 +1,221 @@
+import os
+import json
+
+def writeJsonAtomically(jsonPath: str, data: dict):
+    """
+    Writes the given data as a JSON file, replacing the previous file only once the new one is completely written
+
+    Parameters
+    ----------
+    jsonPath: str
+        The path of the JSON file
+    data: dict
+        The data to be written
+    """
+    temporaryPath = f'{jsonPath}.tmp'
+    with open(temporaryPath, 'w') as jsonFile:
+        json.dump(data, jsonFile, indent=2)
+        jsonFile.flush()
+        os.fsync(jsonFile.fileno())
+    os.replace(temporaryPath, jsonPath)
+
+def loadJsonIfExists(jsonPath: str):
+    """
+    Loads the given JSON file if it exists and is readable
+
+    Parameters
+    ----------
+    jsonPath: str
+        The path of the JSON file
+
+    Returns
+    -------
+    data: dict
+        The loaded data, or None if the file does not exist or cannot be parsed
+    """
+    if not os.path.exists(jsonPath):
+        return None
+    try:
+        with open(jsonPath, 'r') as jsonFile:
+            return json.load(jsonFile)
+    except (OSError, json.JSONDecodeError) as error:
+        print(f"- Error while reading '{jsonPath}': {str(error)}")
+        return None
+
+def getManifestParameters(configs: dict):
+    """
+    Provides the frame extraction parameters that the extracted frames depend on (a run can only be resumed with the same ones)
+
+    Parameters
+    ----------
+    configs: dict
+        The configurations dictionary
+
+    Returns
+    -------
+    parameters: dict
+        The frame extraction parameters
+    """
+    return {
+        'frequency': configs['frequency'],
+        'output_format': configs['output_format'],
+        'model_input_size': configs['model_input_size'],
+        'frames_container': configs.get('frames_container', 'files'),
+        'dedup_threshold': configs.get('dedup_threshold', 0)
+    }
+
+def loadFramesManifest(framesDir: str):
+    """
+    Loads the manifest of a movie frames folder
+
+    Parameters
+    ----------
+    framesDir: str
+        The frames directory of the movie
+
+    Returns
+    -------
+    manifest: dict
+        The manifest containing the 'video', 'parameters', 'segments' and 'completed' keys (None if there is no manifest)
+    """
+    return loadJsonIfExists(os.path.join(framesDir, 'manifest.json'))
+
+def saveFramesManifest(framesDir: str, manifest: dict):
+    """
+    Saves the manifest of a movie frames folder
+
+    Parameters
+    ----------
+    framesDir: str
+        The frames directory of the movie
+    manifest: dict
+        The manifest to be saved
+    """
+    writeJsonAtomically(os.path.join(framesDir, 'manifest.json'), manifest)
+
+def isFramesFolderCompleted(framesDir: str):
+    """
+    Checks whether the frame extraction of a movie is completed (folders without a manifest are considered complete)
+
+    Parameters
+    ----------
+    framesDir: str
+        The frames directory of the movie
+
+    Returns
+    -------
+    isCompleted: bool
+        False if the manifest of the folder marks the extraction as not completed
+    """
+    manifest = loadFramesManifest(framesDir)
+    return manifest is None or manifest.get('completed', False)
+
+def getCheckpointPath(framesDir: str, startSample: int):
+    """
+    Provides the checkpoint file path of a segment (time range) of a movie
+
+    Parameters
+    ----------
+    framesDir: str
+        The frames directory of the movie
+    startSample: int
+        The global index of the first sampled frame of the segment
+
+    Returns
+    -------
+    checkpointPath: str
+        The checkpoint file path
+    """
+    return os.path.join(framesDir, 'checkpoint_frame{0:07d}.json'.format(startSample))
+
+def loadSegmentCheckpoint(framesDir: str, startSample: int):
+    """
+    Loads the checkpoint of a segment (time range) of a movie
+
+    Parameters
+    ----------
+    framesDir: str
+        The frames directory of the movie
+    startSample: int
+        The global index of the first sampled frame of the segment
+
+    Returns
+    -------
+    checkpoint: dict
+        The checkpoint containing the 'lastCommittedFrame', 'completed' and 'duplicates' keys (None if there is no checkpoint)
+    """
+    return loadJsonIfExists(getCheckpointPath(framesDir, startSample))
+
+def saveSegmentCheckpoint(framesDir: str, startSample: int, lastCommittedFrame: int, completed: bool = False, duplicates: dict = None):
+    """
+    Saves the checkpoint of a segment (time range) of a movie
+
+    Parameters
+    ----------
+    framesDir: str
+        The frames directory of the movie
+    startSample: int
+        The global index of the first sampled frame of the segment
+    lastCommittedFrame: int
+        The global index of the last frame which is completely saved (startSample - 1 if none)
+    completed: bool
+        Whether the extraction of the segment is completed
+    duplicates: dict
+        The mapping of the dropped near-duplicate frames to the kept frames they duplicate (e.g., {frame0000002: frame0000001})
+    """
+    writeJsonAtomically(getCheckpointPath(framesDir, startSample),
+                        {'lastCommittedFrame': lastCommittedFrame, 'completed': completed, 'duplicates': duplicates or {}})
+
+def finalizeFramesManifest(framesDir: str, manifest: dict):
+    """
+    Marks the frame extraction of a movie as completed, if all of its segments are completed
+
+    Parameters
+    ----------
+    framesDir: str
+        The frames directory of the movie
+    manifest: dict
+        The manifest of the movie
+
+    Returns
+    -------
+    isCompleted: bool
+        Whether the frame extraction of the movie is completed
+    """
+    # Check the checkpoints of all segments
+    checkpoints = [loadSegmentCheckpoint(framesDir, startSample) for startSample, _, _ in manifest['segments']]
+    if any(checkpoint is None or not checkpoint.get('completed', False) for checkpoint in checkpoints):
+        return False
+    # Record the last committed frame, the dropped near-duplicate frames and the completion marker
+    manifest['lastCommittedFrame'] = max(checkpoint['lastCommittedFrame'] for checkpoint in checkpoints)
+    manifest['duplicates'] = {}
+    for checkpoint in checkpoints:
+        manifest['duplicates'].update(checkpoint.get('duplicates', {}))
+    manifest['completed'] = True
+    saveFramesManifest(framesDir, manifest)
+    # Remove the (no longer needed) checkpoints
+    for startSample, _, _ in manifest['segments']:
+        os.remove(getCheckpointPath(framesDir, startSample))
+    return True
+
+def loadDuplicateFrames(framesDir: str):
+    """
+    Loads the near-duplicate frames dropped during the frame extraction of a movie, grouped by the kept frame they duplicate
+
+    Parameters
+    ----------
+    framesDir: str
+        The frames directory of the movie
+
+    Returns
+    -------
+    duplicateFrames: dict
+        The mapping of each kept frame to the sorted list of its dropped duplicates (empty if none is dropped)
+    """
+    duplicateFrames = {}
+    manifest = loadFramesManifest(framesDir)
+    if manifest is None:
+        return duplicateFrames
+    for droppedFrameId, keptFrameId in sorted(manifest.get('duplicates', {}).items()):
+        duplicateFrames.setdefault(keptFrameId, []).append(droppedFrameId)
+    return duplicateFrames
@@ -0,0 +1,173 @@
+import os
+import cv2 as cv
+import threading
+import numpy as np
+from glob import glob
+
+class FrameFilesReader:
+    """
+    Reads the frames of a movie saved as separate image files (e.g., frame0000001.jpg), in frame-index order
+    """
+
+    def __init__(self, framesDir: str, imageTypes: list):
+        """
+        Parameters
+        ----------
+        framesDir: str
+            The frames directory of the movie
+        imageTypes: list
+            The supported image formats (e.g., ["png", "jpg", "jpeg"])
+        """
+        self.framePaths = []
+        for imageType in imageTypes:
+            self.framePaths.extend(glob(f'{framesDir}/*.{imageType}'))
+        # Zero-padded frame names keep the temporal order when sorted
+        self.framePaths.sort(key=os.path.basename)
+        self.frameIds = [os.path.splitext(os.path.basename(framePath))[0] for framePath in self.framePaths]
+
+    def __len__(self):
+        return len(self.frameIds)
+
+    def readFrame(self, position: int):
+        """
+        Reads the encoded content of the frame at the given position
+
+        Parameters
+        ----------
+        position: int
+            The position of the frame in the movie (0 for the first frame)
+
+        Returns
+        -------
+        encodedFrame: bytes
+            The encoded frame content
+        """
+        with open(self.framePaths[position], 'rb') as frameFile:
+            return frameFile.read()
+
+    def __iter__(self):
+        for position, frameId in enumerate(self.frameIds):
+            yield frameId, self.readFrame(position)
+
+    def close(self):
+        pass
+
+class FrameShardReader:
+    """
+    Reads the frames of a movie packed into shard files by FrameShardWriter, in frame-index order
+    """
+
+    def __init__(self, framesDir: str):
+        """
+        Parameters
+        ----------
+        framesDir: str
+            The frames directory of the movie, containing the 'shard_*.bin' and 'shard_*.idx' files
+        """
+        self.entries = []
+        self.openShards = {}
+        self.lock = threading.Lock()
+        for indexPath in glob(f'{framesDir}/shard_*.idx'):
+            shardPath = indexPath[:-4] + '.bin'
+            if not os.path.exists(shardPath):
+                continue
+            shardLength = os.path.getsize(shardPath)
+            with open(indexPath, 'r') as indexFile:
+                for line in indexFile:
+                    fields = line.split()
+                    # Skip partially written entries and entries pointing beyond the written data
+                    if len(fields) != 3 or int(fields[1]) + int(fields[2]) > shardLength:
+                        continue
+                    self.entries.append((fields[0], shardPath, int(fields[1]), int(fields[2])))
+        # Zero-padded frame identifiers keep the temporal order when sorted
+        self.entries.sort(key=lambda entry: entry[0])
+        self.frameIds = [entry[0] for entry in self.entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def readFrame(self, position: int):
+        """
+        Reads the encoded content of the frame at the given position (random access through the offset index)
+
+        Parameters
+        ----------
+        position: int
+            The position of the frame in the movie (0 for the first frame)
+
+        Returns
+        -------
+        encodedFrame: bytes
+            The encoded frame content
+        """
+        _, shardPath, offset, length = self.entries[position]
+        with self.lock:
+            if shardPath not in self.openShards:
+                self.openShards[shardPath] = open(shardPath, 'rb')
+            shardFile = self.openShards[shardPath]
+            shardFile.seek(offset)
+            return shardFile.read(length)
+
+    def __iter__(self):
+        for position, frameId in enumerate(self.frameIds):
+            yield frameId, self.readFrame(position)
+
+    def close(self):
+        with self.lock:
+            for shardFile in self.openShards.values():
+                shardFile.close()
+            self.openShards = {}
+
+def isShardedFramesFolder(framesDir: str):
+    """
+    Checks whether the given frames directory contains frames packed into shards
+
+    Parameters
+    ----------
+    framesDir: str
+        The frames directory of the movie
+
+    Returns
+    -------
+    isSharded: bool
+        True if the directory contains shard index files
+    """
+    return len(glob(f'{framesDir}/shard_*.idx')) > 0
+
+def openMovieFrames(framesDir: str, imageTypes: list):
+    """
+    Opens the frames of a movie for streaming or random access, whether saved as files or packed into shards
+
+    Parameters
+    ----------
+    framesDir: str
+        The frames directory of the movie
+    imageTypes: list
+        The supported image formats of the frame files (e.g., ["png", "jpg", "jpeg"])
+
+    Returns
+    -------
+    framesReader: FrameFilesReader or FrameShardReader
+        The reader providing the 'frameIds', 'readFrame(position)' and iteration over (frameId, encodedFrame)
+    """
+    if isShardedFramesFolder(framesDir):
+        return FrameShardReader(framesDir)
+    return FrameFilesReader(framesDir, imageTypes)
+
+def decodeFrame(encodedFrame: bytes, flags: int = cv.IMREAD_COLOR):
+    """
+    Decodes the given encoded frame content
+
+    Parameters
+    ----------
+    encodedFrame: bytes
+        The encoded frame content
+    flags: int
+        The OpenCV image reading flags (e.g., cv.IMREAD_GRAYSCALE)
+
+    Returns
+    -------
+    frame: cv.Mat
+        The decoded frame, or None if it cannot be decoded
+    """
+    return cv.imdecode(np.frombuffer(encodedFrame, dtype=np.uint8), flags)
@@ -0,0 +1,284 @@
+import os
+import time
+import queue
+import cv2 as cv
+import threading
+from glob import glob
+
+def saveFrame(frame: cv.Mat, frameId: str, outputDir: str, fileFormat: str, timings: dict, shardWriter=None):
+    """
+    Encodes the given frame and writes it to a file (or a shard), while measuring the time of each step
+
+    Parameters
+    ----------
+    frame: cv.Mat
+        The frame to be saved
+    frameId: str
+        The identifier of the frame (e.g., frame0000001)
+    outputDir: str
+        The output frames directory of the movie
+    fileFormat: str
+        The output file format (e.g., jpg)
+    timings: dict
+        The dictionary accumulating the 'encode' and 'write' times (in seconds)
+    shardWriter: FrameShardWriter
+        The shard writer to append the frame to, or None to save the frame as a separate file
+    """
+    # Encode the frame into the given image format
+    stepTime = time.perf_counter()
+    success, encodedFrame = cv.imencode(f'.{fileFormat}', frame)
+    timings['encode'] += time.perf_counter() - stepTime
+    if not success:
+        raise ValueError(f'could not encode the frame as "{fileFormat}"')
+    # Write the encoded frame to the disk
+    stepTime = time.perf_counter()
+    if shardWriter is None:
+        encodedFrame.tofile(f"{outputDir}/{frameId}.{fileFormat}")
+    else:
+        shardWriter.write(frameId, encodedFrame.tobytes())
+    timings['write'] += time.perf_counter() - stepTime
+
+def frameWriterWorker(framesQueue: queue.Queue, outputDir: str, fileFormat: str, shardWriter, timings: dict, failedFrames: list):
+    """
+    Saves the frames received from the given queue, until a None item is received
+
+    Parameters
+    ----------
+    framesQueue: queue.Queue
+        The queue providing (frame, frameId) items
+    outputDir: str
+        The output frames directory of the movie
+    fileFormat: str
+        The output file format (e.g., jpg)
+    shardWriter: FrameShardWriter
+        The shard writer to append the frames to, or None to save the frames as separate files
+    timings: dict
+        The dictionary accumulating the 'encode' and 'write' times of this writer
+    failedFrames: list
+        The list (shared by the writers) recording the identifiers of the frames which could not be saved
+    """
+    while True:
+        item = framesQueue.get()
+        # Stop the writer if the stop signal is received
+        if item is None:
+            framesQueue.task_done()
+            return
+        frame, frameId = item
+        try:
+            saveFrame(frame, frameId, outputDir, fileFormat, timings, shardWriter)
+        except Exception as error:
+            print(f'- Error while saving the frame "{frameId}" in "{outputDir}": {str(error)}')
+            failedFrames.append(frameId)
+        finally:
+            framesQueue.task_done()
+
+def startFrameWriters(numWriters: int, queueSize: int, outputDir: str, fileFormat: str, shardWriter=None):
+    """
+    Starts a pool of frame writer threads that encode and write frames while the decoder continues
+
+    Parameters
+    ----------
+    numWriters: int
+        The number of writer threads (0 to save frames inline, without writer threads)
+    queueSize: int
+        The maximum number of frames waiting to be saved (the decoder blocks when the queue is full)
+    outputDir: str
+        The output frames directory of the movie
+    fileFormat: str
+        The output file format (e.g., jpg)
+    shardWriter: FrameShardWriter
+        The shard writer to append the frames to, or None to save the frames as separate files
+
+    Returns
+    -------
+    framesQueue: queue.Queue
+        The bounded queue to put the (frame, frameId) items in (None if no writers are started)
+    frameWriters: list
+        The list of started writer threads
+    writerTimings: list
+        The list of timing dictionaries, one per writer thread
+    failedFrames: list
+        The list recording the identifiers of the frames the writers could not save
+    """
+    failedFrames = []
+    if numWriters <= 0:
+        return None, [], [], failedFrames
+    # The bounded queue caps the memory used by the frames waiting to be saved (backpressure)
+    framesQueue = queue.Queue(maxsize=max(queueSize, 1))
+    writerTimings = [{'encode': 0.0, 'write': 0.0} for _ in range(numWriters)]
+    frameWriters = [threading.Thread(target=frameWriterWorker, args=(framesQueue, outputDir, fileFormat, shardWriter, timings, failedFrames),
+                                     daemon=True)
+                    for timings in writerTimings]
+    for frameWriter in frameWriters:
+        frameWriter.start()
+    return framesQueue, frameWriters, writerTimings, failedFrames
+
+def checkSavedFrames(failedFrames: list):
+    """
+    Checks that the writers saved all the frames handed over to them
+
+    Parameters
+    ----------
+    failedFrames: list
+        The identifiers of the frames the writers could not save
+
+    Raises
+    ------
+    OSError
+        If any frame could not be saved (so that it is not recorded as committed)
+    """
+    if failedFrames:
+        raise OSError(f'could not save {len(failedFrames)} frames (e.g., "{sorted(failedFrames)[0]}")')
+
+def stopFrameWriters(framesQueue: queue.Queue, frameWriters: list):
+    """
+    Waits for the pending frames to be saved and stops the given writer threads
+
+    Parameters
+    ----------
+    framesQueue: queue.Queue
+        The queue of the writer threads
+    frameWriters: list
+        The list of writer threads to stop
+    """
+    if framesQueue is None:
+        return
+    for _ in frameWriters:
+        framesQueue.put(None)
+    for frameWriter in frameWriters:
+        frameWriter.join()
+
+class FrameShardWriter:
+    """
+    Packs the encoded frames of a movie into a few append-only shard files, instead of one file per frame
+        - Each shard 'shard_<firstFrameId>.bin' holds the concatenated encoded frames
+        - Each shard has an offset index 'shard_<firstFrameId>.idx' with one 'frameId offset length' line per frame
+    """
+
+    def __init__(self, outputDir: str, shardSize: int = 1000):
+        """
+        Parameters
+        ----------
+        outputDir: str
+            The output frames directory of the movie
+        shardSize: int
+            The maximum number of frames in each shard
+        """
+        self.outputDir = outputDir
+        self.shardSize = max(shardSize, 1)
+        self.lock = threading.Lock()
+        self.dataFile = None
+        self.indexFile = None
+        self.shardFrames = 0
+        self.offset = 0
+
+    def openShard(self, frameId: str):
+        """
+        Closes the current shard and opens a new one, named after its first frame
+
+        Parameters
+        ----------
+        frameId: str
+            The identifier of the first frame of the shard
+        """
+        self.close()
+        shardPath = f"{self.outputDir}/shard_{frameId}"
+        self.dataFile = open(f"{shardPath}.bin", 'ab')
+        self.indexFile = open(f"{shardPath}.idx", 'a')
+        self.offset = self.dataFile.tell()
+        self.shardFrames = 0
+
+    def write(self, frameId: str, encodedFrame: bytes):
+        """
+        Appends an encoded frame to the current shard and records its offset in the index
+
+        Parameters
+        ----------
+        frameId: str
+            The identifier of the frame (e.g., frame0000001)
+        encodedFrame: bytes
+            The encoded frame content
+        """
+        with self.lock:
+            if self.dataFile is None or self.shardFrames >= self.shardSize:
+                self.openShard(frameId)
+            # Write the data before its index entry (readers ignore entries pointing beyond the written data)
+            self.dataFile.write(encodedFrame)
+            self.indexFile.write(f'{frameId} {self.offset} {len(encodedFrame)}\n')
+            self.offset += len(encodedFrame)
+            self.shardFrames += 1
+
+    def flush(self):
+        """
+        Flushes the written frames and their index entries to the disk
+        """
+        with self.lock:
+            if self.dataFile is not None:
+                self.dataFile.flush()
+                self.indexFile.flush()
+
+    def close(self):
+        """
+        Closes the current shard
+        """
+        if self.dataFile is not None:
+            self.dataFile.close()
+            self.indexFile.close()
+            self.dataFile, self.indexFile = None, None
+
+def discardUncommittedShardFrames(outputDir: str, startSample: int, endSample: int, resumeSample: int):
+    """
+    Discards the frames of a segment appended to its shards after its last checkpoint, so that they can be re-extracted
+
+    Parameters
+    ----------
+    outputDir: str
+        The output frames directory of the movie
+    startSample: int
+        The global index of the first sampled frame of the segment
+    endSample: int
+        The global index of the sampled frame the segment stops at (exclusive), or None for the end of the video
+    resumeSample: int
+        The global index of the first frame to be re-extracted
+    """
+    for indexPath in glob(f'{outputDir}/shard_frame*.idx'):
+        # Only process the shards of the given segment
+        firstFrame = int(os.path.basename(indexPath)[len('shard_frame'):-len('.idx')])
+        if firstFrame < startSample or (endSample is not None and firstFrame >= endSample):
+            continue
+        shardPath = indexPath[:-4] + '.bin'
+        # Keep the entries of the committed frames (they were all written before the uncommitted ones)
+        keptEntries = []
+        shardLength = 0
+        with open(indexPath, 'r') as indexFile:
+            for line in indexFile:
+                fields = line.split()
+                if len(fields) == 3 and int(fields[0][len('frame'):]) < resumeSample:
+                    keptEntries.append(line)
+                    shardLength = max(shardLength, int(fields[1]) + int(fields[2]))
+        # Remove the shard if none of its frames is committed
+        if not keptEntries:
+            os.remove(indexPath)
+            if os.path.exists(shardPath):
+                os.remove(shardPath)
+            continue
+        # Otherwise, truncate the shard and its index
+        with open(indexPath, 'w') as indexFile:
+            indexFile.writelines(keptEntries)
+        os.truncate(shardPath, shardLength)
+
+def formatTimings(timings: dict):
+    """
+    Formats the time breakdown of the frame extraction steps, so that the bottleneck can be spotted
+
+    Parameters
+    ----------
+    timings: dict
+        The dictionary containing the accumulated time (in seconds) of each step
+
+    Returns
+    -------
+    timingsText: str
+        The formatted time breakdown
+    """
+    return ', '.join(f'{step} {stepTime:.2f}s' for step, stepTime in timings.items())
@@ -3,6 +3,7 @@ import string
 import cv2 as cv
 import numpy as np
 from glob import glob
+from movifex.pipelines.frames.frameManifest import loadFramesManifest
 
 def initMovieVideos(configs: dict):
     """
@@ -21,14 +22,14 @@ def initMovieVideos(configs: dict):
     # Variables
     videoFiles = []
     videoTypes = configs['video_formats']
-    moviesDir, framesDir = configs['movies_path'], configs['frames_path']
+    moviesDir, framesDir = configs['movies_path'], configs.get('frames_path')
     # Check if the given directory exists
     if not os.path.exists(moviesDir):
         print(f"Input movie videos directory '{moviesDir}' does not exist! Exiting ...")
         return False
     print(f"Movie videos will be processed from '{moviesDir}' ...")
-    # Check if the output directory exists and create it if not
-    if not os.path.exists(framesDir):
+    # Check if the output directory exists and create it if not (if frames are to be saved)
+    if framesDir and not os.path.exists(framesDir):
         os.mkdir(framesDir)
         print(f"Output frames will be saved in '{framesDir}' ...")
     # Check the supported video types
@@ -44,6 +45,26 @@ def initMovieVideos(configs: dict):
     # Return the list of video files
     return videoFiles
 
+def normalizeVideoName(videoFileAddress: str):
+    """
+    Normalizes the name of the given video file, to be used as the name of its output folders
+
+    Parameters
+    ----------
+    videoFileAddress: str
+        The video file address
+
+    Returns
+    -------
+    videoName: str
+        The normalized video name (e.g., 'the_movie.mp4' --> 'Themovie')
+    """
+    # Accessing video file
+    videoName = os.path.basename(videoFileAddress)
+    # Normalizing the video name to assign it to the output folder
+    return string.capwords(
+        videoName.split('.')[0].replace("_", "")).replace(" ", "")
+
 def initFramesFolder(videoFileAddress: str, framesDir: str):
     """
     Pre-checks and generates the output frames folder
@@ -60,17 +81,19 @@ def initFramesFolder(videoFileAddress: str, framesDir: str):
     generatedPath: str
         The generated frames directory path
     """
-    # Accessing video file
-    videoName = os.path.basename(videoFileAddress)
     # Normalizing the video name to assign it to the output folder
-    videoName = string.capwords(
-        videoName.split('.')[0].replace("_", "")).replace(" ", "")
+    videoName = normalizeVideoName(videoFileAddress)
     # Creating output folder
     if not os.path.exists(framesDir):
         os.mkdir(framesDir)
     generatedPath = os.path.join(framesDir, videoName)
     # Do not re-generate frames for movies if there is a folder with their normalized name
     if os.path.exists(generatedPath):
+        # Unless the manifest of the folder shows that a previous run was interrupted, so it can be resumed
+        manifest = loadFramesManifest(generatedPath)
+        if manifest is not None and not manifest.get('completed', False):
+            print(f'- Resuming {videoName} from the interrupted extraction in its output folder!')
+            return generatedPath
         print(
             f'- Skipping {videoName} due to finding an output folder with the same name!')
         return
@@ -78,6 +101,160 @@ def initFramesFolder(videoFileAddress: str, framesDir: str):
         os.mkdir(generatedPath)
         return generatedPath
 
+# Typical byte rate (1 MB/s, i.e., 8 Mbit/s) estimating the duration of the videos whose header is not readable
+FALLBACK_VIDEO_BYTE_RATE = 1e6
+
+def getVideoDuration(videoFileAddress: str):
+    """
+    Estimates the duration of the given video file (used for scheduling the extraction workload)
+
+    Parameters
+    ----------
+    videoFileAddress: str
+        The video file address to estimate the duration for
+
+    Returns
+    -------
+    duration: float
+        The duration of the video in seconds (estimated from its file size if the header is not readable)
+    """
+    # Read the frame count and the frame rate from the video header
+    capturedVideo = cv.VideoCapture(videoFileAddress)
+    frameCount = capturedVideo.get(cv.CAP_PROP_FRAME_COUNT)
+    frameRate = capturedVideo.get(cv.CAP_PROP_FPS)
+    capturedVideo.release()
+    if frameCount > 0 and frameRate > 0:
+        return frameCount / frameRate
+    # Fall back to the file size, which is roughly proportional to the duration, converted into seconds with a typical bitrate
+    return os.path.getsize(videoFileAddress) / FALLBACK_VIDEO_BYTE_RATE
+
+def getFramePickingRate(capturedVideo: cv.VideoCapture, frequency: int):
+    """
+    Calculates the distance (in frames) between two sampled frames of a captured video
+
+    Parameters
+    ----------
+    capturedVideo: cv.VideoCapture
+        The captured video to sample frames from
+    frequency: int
+        The frequency of frames extraction (picking 'n' frames every second)
+
+    Returns
+    -------
+    frameRate: int
+        The frame rate of the video
+    frequency: int
+        The frequency of frames extraction, capped to the frame rate of the video
+    framePickingRate: int
+        The distance (in frames) between two sampled frames
+    """
+    # Get the frame rate and compare it with the given frame rate
+    frameRate = int(capturedVideo.get(cv.CAP_PROP_FPS))
+    if frequency > frameRate:
+        frequency = frameRate
+    # Set a frame to pick
+    framePickingRate = int(frameRate / frequency)
+    return frameRate, frequency, framePickingRate
+
+def splitVideoIntoSegments(videoFileAddress: str, frequency: int, numSegments: int = 1):
+    """
+    Splits the given video into time ranges of sampled frames, so that each range can be extracted separately
+
+    Parameters
+    ----------
+    videoFileAddress: str
+        The video file address to split
+    frequency: int
+        The frequency of frames extraction (picking 'n' frames every second)
+    numSegments: int
+        The number of segments to split the video into
+
+    Returns
+    -------
+    segments: list
+        A list of (startSample, endSample, duration) tuples, where the samples are the global indices of the
+        sampled frames (the end is exclusive, and None for the last segment to read until the end of the video)
+    """
+    # Variables
+    duration = getVideoDuration(videoFileAddress)
+    # Read the number of frames to be sampled from the video header
+    capturedVideo = cv.VideoCapture(videoFileAddress)
+    frameCount = int(capturedVideo.get(cv.CAP_PROP_FRAME_COUNT))
+    try:
+        _, _, framePickingRate = getFramePickingRate(capturedVideo, frequency)
+    except ZeroDivisionError:
+        framePickingRate = 0
+    capturedVideo.release()
+    # Keep the whole video as a single segment if it cannot (or should not) be split
+    totalSamples = -(-frameCount // framePickingRate) if framePickingRate > 0 else 0
+    numSegments = min(numSegments, totalSamples)
+    if numSegments <= 1:
+        return [(0, None, duration)]
+    # Split the sampled frames into (almost) equal consecutive ranges
+    segments = []
+    for segmentIndex in range(numSegments):
+        startSample = (totalSamples * segmentIndex) // numSegments
+        endSample = (totalSamples * (segmentIndex + 1)) // numSegments
+        segmentDuration = duration * (endSample - startSample) / totalSamples
+        # The last segment reads until the end of the video, as the frame count in the header is an estimate
+        segments.append((startSample, endSample if segmentIndex < numSegments - 1 else None, segmentDuration))
+    return segments
+
+def sampleVideoFrames(capturedVideo: cv.VideoCapture, framePickingRate: int, samplingMode: str = 'grab', startFrame: int = 0):
+    """
+    Iterates over the sampled frames of a captured video, decoding only the frames to be kept
+
+    Parameters
+    ----------
+    capturedVideo: cv.VideoCapture
+        The captured video to sample frames from
+    framePickingRate: int
+        The distance (in frames) between two sampled frames
+    samplingMode: str
+        The sampling mode, where 'read' decodes all frames, 'grab' only demuxes the unsampled
+        frames without decoding them, and 'seek' jumps directly to the sampled frames
+    startFrame: int
+        The index of the first frame to pick (the video is sought to this frame before sampling)
+
+    Yields
+    ------
+    frameIndex: int
+        The index of the sampled frame in the video
+    frame: cv.Mat
+        The decoded sampled frame
+    """
+    # Variables
+    frameIndex = 0
+    frameIndexToPick = 0
+    # Seek to the first frame to pick, if sampling does not start from the beginning of the video
+    if startFrame > 0:
+        capturedVideo.set(cv.CAP_PROP_POS_FRAMES, startFrame)
+        frameIndex = frameIndexToPick = startFrame
+    while True:
+        if samplingMode == 'seek':
+            # Jump to the next frame to pick (no need to seek if it is the next frame)
+            if frameIndex != frameIndexToPick:
+                capturedVideo.set(cv.CAP_PROP_POS_FRAMES, frameIndexToPick)
+                frameIndex = frameIndexToPick
+            success, frame = capturedVideo.read()
+        elif samplingMode == 'read':
+            # Decode every frame and keep only the ones to pick
+            success, frame = capturedVideo.read()
+        else:
+            # Advance the container without decoding, and decode only the frames to pick
+            success = capturedVideo.grab()
+            if success and frameIndex == frameIndexToPick:
+                success, frame = capturedVideo.retrieve()
+        # If the end of the video is reached
+        if not success:
+            return
+        # Pick only the frames with the given picking rate
+        if frameIndex == frameIndexToPick:
+            yield frameIndex, frame
+            frameIndexToPick += framePickingRate
+        # Increment the frame index
+        frameIndex += 1
+
 def resizeFrame(frame: cv.Mat, networkInputSize: int = 300):
     """
     Resize the given frame while preserving its aspect ratio
@@ -108,6 +285,50 @@ def resizeFrame(frame: cv.Mat, networkInputSize: int = 300):
     return pFrame
 
 
+def computeFrameSignature(frame: cv.Mat, signatureSize: int = 16):
+    """
+    Computes a cheap low-resolution grayscale signature of the given frame, used to compare frames without a CNN
+
+    Parameters
+    ----------
+    frame: cv.Mat
+        The frame (BGR or grayscale) to compute the signature for
+    signatureSize: int
+        The width and height of the downscaled signature
+
+    Returns
+    -------
+    signature: np.ndarray
+        The flattened float32 signature with values in [0, 255]
+    """
+    # Downscale first, so that the color conversion runs on a tiny image
+    signature = cv.resize(frame, (signatureSize, signatureSize), interpolation=cv.INTER_AREA)
+    if signature.ndim == 3:
+        signature = cv.cvtColor(signature, cv.COLOR_BGR2GRAY)
+    return signature.astype(np.float32).flatten()
+
+def isNearDuplicateFrame(prevSignature: np.ndarray, currSignature: np.ndarray, threshold: float):
+    """
+    Checks whether two frames are nearly identical, based on the mean absolute difference of their signatures
+
+    Parameters
+    ----------
+    prevSignature: np.ndarray
+        The signature of the previous (kept) frame, or None if there is no previous frame
+    currSignature: np.ndarray
+        The signature of the current frame
+    threshold: float
+        The maximum mean absolute difference (in gray levels, 0-255) for the frames to be near-duplicates
+
+    Returns
+    -------
+    isDuplicate: bool
+        True if the frames are near-duplicates
+    """
+    if prevSignature is None:
+        return False
+    return float(np.mean(np.abs(currSignature - prevSignature))) < threshold
+
 def generateSquareFrame(frame: cv.Mat, networkInputSize: int = 300):
     """
     Generate a square frame from the given frame
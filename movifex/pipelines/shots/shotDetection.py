@@ -1,13 +1,24 @@
 import os
 import time
+import shutil
 import cv2 as cv
 import pandas as pd
-from movifex.pipelines.visual_features.utils import packetManager
-from movifex.pipelines.shots.utils import calculateCosineSimilarity, calculateShotBoundaries, initShotsFolder, mergePacketsIntoDataFrame
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from movifex.pipelines.visual_features.utils import PacketBuffer
+from movifex.pipelines.frames.frameReader import openMovieFrames, decodeFrame
+from movifex.pipelines.visual_features.packets import listPacketFiles, loadMovieFeatures, getPacketsFingerprint
+from movifex.pipelines.shots.utils import calculateCosineSimilarity, calculateFeaturesCosineSimilarity, calculateShotBoundaries, initShotsFolder, detectFrameShotBoundaries
+from movifex.pipelines.shots.utils import getSimilarityCachePath, saveSimilarityCache, loadSimilarityCache, countShotsPerThreshold
+
+# Supported engines of the shot detection from frames
+SHOT_DETECTION_ENGINES = ['legacy', 'fast']
 
 def extractShotsFromMovieFrames(configs: dict, movieFramesPaths: list):
     """
     Extracts shots from the given set of extracted movie frames
+        - The 'legacy' engine compares the full-size frames with the first frame, one pair at a time
+        - The 'fast' engine compares the small grayscale signatures of adjacent frames in batches, saving the first frame of each shot
+          (their similarities differ, so the 'fast' engine has its own 'fast_threshold')
 
     Parameters
     ----------
@@ -17,52 +28,185 @@ def extractShotsFromMovieFrames(configs: dict, movieFramesPaths: list):
         The list of movie frames paths
     """
     print("Extracting movie shots from the given set of movie frames ...")
-    # Iterate on all frames folders in the given directory
+    engine = configs.get('engine', 'legacy')
+    if engine not in SHOT_DETECTION_ENGINES:
+        print(f"Shot detection engine '{engine}' is not supported! Exiting ...")
+        return
+    # Preparing the output shots frames directories (movies with an existing output folder are skipped)
+    shotJobs = []
     for framesFolder in movieFramesPaths:
-        # Preparing the output shots frames directory
         framesFolder = os.path.normpath(framesFolder)
         outputDir = initShotsFolder(framesFolder, configs['shot_frames_path'])
-        if not outputDir:
-            continue
-        # Picking shot features from the given features folder
-        try:
-            # Variables
-            totalShots = 0
-            prevFrame = None
-            startTime = time.time()
-            folderName = os.path.basename(framesFolder)
-            totalFrames = len(os.listdir(framesFolder))
-            # Loop over the frames to pick the shots
-            if totalFrames < 1:
-                print(f'- No frames found in "{framesFolder}"! Skipping ...')
+        if outputDir:
+            shotJobs.append((framesFolder, outputDir))
+    runShotDetectionJobs(extractMovieFrameShots, shotJobs, configs)
+
+def extractMovieFrameShots(framesFolder: str, outputDir: str, configs: dict):
+    """
+    Extracts the shots of a single movie from its extracted frames into its output shots frames directory
+
+    Parameters
+    ----------
+    framesFolder: str
+        The frames folder of the movie
+    outputDir: str
+        The output shots frames directory of the movie
+    configs: dict
+        The configurations dictionary
+
+    Returns
+    -------
+    totalFrames: int
+        The number of processed frames
+    """
+    # Variables
+    totalShots = 0
+    prevFrame = None
+    startTime = time.time()
+    engine = configs.get('engine', 'legacy')
+    folderName = os.path.basename(framesFolder)
+    # Open the frames of the movie (saved as files or packed into shards)
+    framesReader = openMovieFrames(framesFolder, configs['image_formats'])
+    totalFrames = len(framesReader)
+    # Loop over the frames to pick the shots
+    if totalFrames < 1:
+        print(f'- No frames found in "{framesFolder}"! Skipping ...')
+        return 0
+    print(f'- Processing {totalFrames} frames of movie "{folderName}" ...')
+    if engine == 'fast':
+        # Detect the shots on the frame signatures, then decode (at full size) only the first frame of each shot
+        shotFrames = detectFrameShotBoundaries(framesReader, configs.get('fast_threshold', 0.65), configs.get('signature_size', 32),
+                                               configs.get('batch_size', 256))
+        for position in shotFrames:
+            shotPath = os.path.join(outputDir, f"{framesReader.frameIds[position]}.{configs['output_format']}")
+            cv.imwrite(shotPath, decodeFrame(framesReader.readFrame(position)))
+        totalShots = len(shotFrames)
+    else:
+        for frameId, encodedFrame in framesReader:
+            # Decode the frame content
+            currFrame = decodeFrame(encodedFrame)
+            # Check if the frame is read successfully
+            if currFrame is None:
+                print(f'- Error reading frame "{frameId}" in "{framesFolder}"! Skipping ...')
                 continue
-            print(f'- Processing {totalFrames} frames of movie "{folderName}" ...')
-            for frameFile in os.listdir(framesFolder):
-                # Read the frame file
-                framePath = os.path.join(framesFolder, frameFile)
-                currFrame = cv.imread(framePath)
-                # Check if the frame is read successfully
-                if currFrame is None:
-                    print(f'- Error reading frame file "{frameFile}" in "{framesFolder}"! Skipping ...')
-                    continue
-                # If the previous frame is not None, fill it with the current frame
-                if prevFrame is None:
-                    prevFrame = currFrame.copy()
-                    continue
-                # Check the cosine similarity of the frame with the next one
-                isShot = calculateCosineSimilarity(prevFrame, currFrame, configs['threshold'])
-                if isShot:
-                    # Save the current frame as a shot
-                    shotPath = os.path.join(outputDir, frameFile)
-                    cv.imwrite(shotPath, currFrame)
-                    totalShots += 1
-            # Inform the user
-            elapsedTime = '{:.2f}'.format(time.time() - startTime)
-            print(
-                f'- Extracted {totalShots} shots from {totalFrames} frames of "{folderName}" in {elapsedTime} seconds!')
-        except Exception as error:
-            print(f'- Error while picking the shots of "{folderName}" in "{framesFolder}": {str(error)}')
-            continue
+            # If the previous frame is not None, fill it with the current frame
+            if prevFrame is None:
+                prevFrame = currFrame.copy()
+                continue
+            # Check the cosine similarity of the frame with the next one
+            isShot = calculateCosineSimilarity(prevFrame, currFrame, configs['threshold'])
+            if isShot:
+                # Save the current frame as a shot
+                shotPath = os.path.join(outputDir, f"{frameId}.{configs['output_format']}")
+                cv.imwrite(shotPath, currFrame)
+                totalShots += 1
+    framesReader.close()
+    # Inform the user
+    elapsedTime = '{:.2f}'.format(time.time() - startTime)
+    print(
+        f'- Extracted {totalShots} shots from {totalFrames} frames of "{folderName}" in {elapsedTime} seconds!')
+    return totalFrames
+
+def initShotDetectionWorker():
+    """
+    Initializes a shot detection worker process, preventing OpenCV from oversubscribing the CPU cores
+    """
+    cv.setNumThreads(1)
+
+def runShotDetectionJobs(detectMovieShots, shotJobs: list, configs: dict):
+    """
+    Runs the shot detection of each movie, sequentially or distributed over a pool of worker processes, and informs the
+    user about the throughput of the whole run (a failing movie is reported, without stopping the other movies, and its
+    output directory is removed so that the next run retries it)
+
+    Parameters
+    ----------
+    detectMovieShots: function
+        The shot detection of a single movie, given its input folder, its output directory and the configurations, and
+        returning the number of processed frames
+    shotJobs: list
+        The (input folder, output directory) of each movie
+    configs: dict
+        The configurations dictionary
+    """
+    if not shotJobs:
+        print("No movies left to extract shots from! Exiting ...")
+        return
+    # Variables
+    totalFrames = 0
+    failedMovies = []
+    startTime = time.time()
+    numWorkers = min(configs.get('num_workers', 1) or os.cpu_count(), len(shotJobs))
+    # Run sequentially if only one worker is needed
+    if numWorkers == 1:
+        for inputFolder, outputDir in shotJobs:
+            try:
+                totalFrames += detectMovieShots(inputFolder, outputDir, configs)
+            except Exception as error:
+                print(f'- Error while picking the shots of "{os.path.basename(inputFolder)}" in "{inputFolder}": {str(error)}')
+                failedMovies.append(os.path.basename(inputFolder))
+                shutil.rmtree(outputDir, ignore_errors=True)
+    else:
+        # Otherwise, distribute the movies over a pool of worker processes
+        print(f"- Distributing the shot detection of {len(shotJobs)} movies over {numWorkers} worker processes ...")
+        with ProcessPoolExecutor(max_workers=numWorkers, initializer=initShotDetectionWorker) as executor:
+            futures = {executor.submit(detectMovieShots, inputFolder, outputDir, configs): (inputFolder, outputDir)
+                       for inputFolder, outputDir in shotJobs}
+            for future in as_completed(futures):
+                inputFolder, outputDir = futures[future]
+                try:
+                    totalFrames += future.result()
+                except Exception as workerError:
+                    print(f'- Error while picking the shots of "{os.path.basename(inputFolder)}" in "{inputFolder}": {str(workerError)}')
+                    failedMovies.append(os.path.basename(inputFolder))
+                    shutil.rmtree(outputDir, ignore_errors=True)
+    # Inform the user about the throughput of the whole run
+    elapsedTime = max(time.time() - startTime, 1e-6)
+    processedMovies = len(shotJobs) - len(failedMovies)
+    print(f'- Picked the shots of {processedMovies} movies ({totalFrames} frames) using {numWorkers} worker(s) in {elapsedTime:.2f} seconds '
+          f'({totalFrames / elapsedTime:.2f} frames/s, {processedMovies / elapsedTime:.2f} movies/s)!')
+    if failedMovies:
+        print(f'- Failed to pick the shots of {len(failedMovies)} movies (their output folders are removed, run the pipeline again '
+              f'to retry them): {sorted(failedMovies)}')
+
+def getMovieSimilarities(configs: dict, featuresFolder: str, movieFeatures: tuple = None):
+    """
+    Provides the sequential similarities of the features of a movie, from its similarity cache if the packets have not
+    changed since it is saved (otherwise, they are calculated and cached, if a 'similarity_cache_path' is given)
+
+    Parameters
+    ----------
+    configs: dict
+        The configurations dictionary
+    featuresFolder: str
+        The features folder of the movie
+    movieFeatures: tuple
+        The already loaded (frameIds, features) of the movie, or None to load them if needed
+
+    Returns
+    -------
+    frameIds: np.ndarray
+        The identifiers of the frames, in frame-index order
+    similarities: np.ndarray
+        The float32 similarities among sequential features (similarities[i] compares the frames i and i + 1)
+    """
+    folderName = os.path.basename(featuresFolder)
+    cacheDir = configs.get('similarity_cache_path')
+    if cacheDir:
+        cachePath = getSimilarityCachePath(cacheDir, folderName)
+        fingerprint = getPacketsFingerprint(featuresFolder)
+        cachedSimilarities = loadSimilarityCache(cachePath, fingerprint)
+        if cachedSimilarities is not None:
+            print(f'- Loaded the cached similarities of "{folderName}" ...')
+            return cachedSimilarities
+    # Load the packets (in parallel) into a single features matrix, in frame-index order
+    frameIds, features = movieFeatures if movieFeatures is not None else loadMovieFeatures(featuresFolder, configs.get('loader_threads', 4))
+    # Cosine similarity calculation
+    similarities = calculateFeaturesCosineSimilarity(folderName, features)
+    if cacheDir:
+        os.makedirs(cacheDir, exist_ok=True)
+        saveSimilarityCache(cachePath, frameIds, similarities, fingerprint)
+    return frameIds, similarities
 
 def extractShotsFromMovieFeatures(configs: dict, movieFeaturesFolders: list):
     """
@@ -76,69 +220,100 @@ def extractShotsFromMovieFeatures(configs: dict, movieFeaturesFolders: list):
         The list of movie features paths
     """
     print("Extracting movie shots from the given set of movie features ...")
-    # Iterate on all features folders in the given directory
+    # Preparing the output shots features directories (movies with an existing output folder are skipped)
+    shotJobs = []
     for featuresFolder in movieFeaturesFolders:
-        # Preparing the output shots features directory
         featuresFolder = os.path.normpath(featuresFolder)
         outputDir = initShotsFolder(featuresFolder, configs['shot_features_path'])
-        if not outputDir:
-            continue
-        # Picking shot features from the given features folder
+        if outputDir:
+            shotJobs.append((featuresFolder, outputDir))
+    runShotDetectionJobs(extractMovieFeatureShots, shotJobs, configs)
+
+def extractMovieFeatureShots(featuresFolder: str, outputDir: str, configs: dict):
+    """
+    Extracts the shots of a single movie from its extracted features into its output shots features directory
+
+    Parameters
+    ----------
+    featuresFolder: str
+        The features folder of the movie
+    outputDir: str
+        The output shots features directory of the movie
+    configs: dict
+        The configurations dictionary
+
+    Returns
+    -------
+    totalFrames: int
+        The number of processed frames
+    """
+    # Variables
+    startTime = time.time()
+    folderName = os.path.basename(featuresFolder)
+    packetBuffer = PacketBuffer(configs['packet_size'], folderName, outputDir,
+                                packetFormat=configs.get('packet_format', 'json'))
+    # Explore the folder containing the packets (JSON or binary) of extracted visual features
+    totalPackets = len(listPacketFiles(featuresFolder))
+    print(f'- Processing {totalPackets} packets of movie "{folderName}" ...')
+    # Load the packets (in parallel) into a single features matrix, in frame-index order
+    frameIds, features = loadMovieFeatures(featuresFolder, configs.get('loader_threads', 4))
+    # Check if the features matrix is empty
+    if len(frameIds) == 0:
+        print(f'- The packets of "{folderName}" contain no features! Skipping ...')
+        return 0
+    # Print the number of frames in the features matrix
+    print(f'- {len(frameIds)} frames combined into a single features matrix for processing!')
+    # Cosine similarity calculation (or the cached similarities)
+    _, similarities = getMovieSimilarities(configs, featuresFolder, (frameIds, features))
+    # Find shot boundaries and select the middle frame of each shot
+    boundaryFrames = calculateShotBoundaries(similarities, configs['threshold'])
+    print(f'- {len(boundaryFrames)} shot boundaries found in "{folderName}"!')
+    # Buffer the keyframes features to save them in packets
+    for boundaryFrame in boundaryFrames:
+        packetBuffer.append(frameIds[boundaryFrame], features[boundaryFrame])
+    # Save the last (partial) packet
+    packetBuffer.flush()
+    # Inform the user
+    elapsedTime = '{:.2f}'.format(time.time() - startTime)
+    print(
+        f'- Extracted {packetBuffer.packetIndex-1} shot packets from {totalPackets} packets of "{folderName}" in {elapsedTime} seconds!')
+    return len(frameIds)
+
+def sweepShotThresholds(configs: dict, movieFeaturesFolders: list):
+    """
+    Reports the number of shots of each movie detected with each of the given thresholds ('sweep_thresholds'),
+    calculating the sequential similarities of a movie only once (cached in 'similarity_cache_path')
+
+    Parameters
+    ----------
+    configs: dict
+        The configurations dictionary
+    movieFeaturesFolders: list
+        The list of movie features paths
+    """
+    thresholds = configs.get('sweep_thresholds') or [configs['threshold']]
+    print(f"Sweeping the shot boundaries detection thresholds {thresholds} on the given set of movie features ...")
+    shotCounts = {}
+    for featuresFolder in movieFeaturesFolders:
+        featuresFolder = os.path.normpath(featuresFolder)
+        folderName = os.path.basename(featuresFolder)
         try:
-            # Variables
-            packetCounter = 0
-            startTime = time.time()
-            folderName = os.path.basename(featuresFolder)
-            packetIndex = 1  # Holds the name of the packet, e.g. Packet0001
-            shotsDataFrame = pd.DataFrame(columns=['frameId', 'features'])
-            # Ensure the shotsDataFrame has a consistent data type for each column to avoid issues during concatenation
-            shotsDataFrame['frameId'] = shotsDataFrame['frameId'].astype('int32')
-            shotsDataFrame['features'] = shotsDataFrame['features'].astype('object')
-            # Explore the folder containing JSON files (packets) of extracted visual features
-            totalPackets = len(os.listdir(featuresFolder))
-            print(f'- Processing {totalPackets} packets of movie "{folderName}" ...')
-            # Iterate over the packet files to collect them all in a single dataframe
-            featuresDF = mergePacketsIntoDataFrame(featuresFolder)
-            # Check if the features dataframe is empty
-            if featuresDF.empty:
-                print(f'- The DataFrame containing packets data of "{folderName}" is empty! Skipping ...')
-                continue
-            # Print the number of frames in the features dataframe
-            print(f'- {len(featuresDF)} packets combined into a single DataFrame for processing!')
-            # Cosine similarity calculation
-            similarityDF = calculateCosineSimilarity(folderName, featuresDF)
-            # Find shot boundaries and select the middle frame of each shot
-            boundaryFrames = calculateShotBoundaries(similarityDF, configs['threshold'])
-            # Keep only the boundary frames from the features dataframe
-            boundaryDF = featuresDF[featuresDF.index.isin(boundaryFrames)]
-            print(f'- {len(boundaryDF)} shot boundaries found in "{folderName}"!')
-            # Iterate over the keyframes to save them in packets
-            remainingFramesCount = len(boundaryDF)
-            for index, row in boundaryDF.iterrows():
-                # Create a row for the similarity dataframe
-                shotRow = pd.DataFrame([{
-                    'frameId': row['frameId'],
-                    'features': row['features']
-                }])
-                # Append the similarity to the dataframe
-                if not shotRow.isna().all().all():
-                    shotsDataFrame = pd.concat([shotsDataFrame, shotRow], ignore_index=True)
-                packetCounter += 1
-                # Reset the counter only if packetCounter reaches the limit and there is no more frames for process
-                remainingFramesCount -= 1
-                resetCounter = (packetCounter == configs['packet_size']) or (remainingFramesCount == 0)
-                if (resetCounter):
-                    # Save dataFrame as packet in a file
-                    packetManager(packetIndex, shotsDataFrame,
-                                    folderName, outputDir)
-                    # Clear dataFrame rows
-                    shotsDataFrame.drop(shotsDataFrame.index, inplace=True)
-                    packetCounter = 0
-                    packetIndex += 1
-            # Inform the user
-            elapsedTime = '{:.2f}'.format(time.time() - startTime)
-            print(
-                f'- Extracted {packetIndex-1} shot packets from {totalPackets} packets of "{folderName}" in {elapsedTime} seconds!')
+            _, similarities = getMovieSimilarities(configs, featuresFolder)
+            # Count the shots of all thresholds on the similarities
+            startTime = time.perf_counter()
+            shotCounts[folderName] = countShotsPerThreshold(similarities, thresholds)
+            elapsedTime = '{:.2f}'.format((time.perf_counter() - startTime) * 1000)
+            print(f'- Swept {len(thresholds)} thresholds on {len(similarities)} similarities of "{folderName}" in {elapsedTime} milliseconds!')
         except Exception as error:
-            print(f'- Error while picking the shots of "{folderName}" in "{featuresFolder}": {str(error)}')
-            continue
\ No newline at end of file
+            print(f'- Error while sweeping the thresholds of "{folderName}" in "{featuresFolder}": {str(error)}')
+            continue
+    if not shotCounts:
+        return
+    # Report the number of shots per threshold (one row per movie)
+    sweepDF = pd.DataFrame.from_dict(shotCounts, orient='index', columns=[str(threshold) for threshold in thresholds])
+    sweepDF.index.name = 'movie'
+    print(f'- Number of shots per threshold:\n{sweepDF.to_string()}')
+    if configs.get('similarity_cache_path'):
+        sweepFile = os.path.join(configs['similarity_cache_path'], 'threshold_sweep.csv')
+        sweepDF.to_csv(sweepFile)
+        print(f"- Saved the threshold sweep report in '{sweepFile}'")
\ No newline at end of file
@@ -1,11 +1,13 @@
 import os
-import json
 import string
 import cv2 as cv
 import numpy as np
-import pandas as pd
 from glob import glob
 from scipy import spatial
+from movifex.pipelines.frames.utils import computeFrameSignature
+from movifex.pipelines.frames.frameReader import isShardedFramesFolder, decodeFrame
+from movifex.pipelines.frames.frameManifest import isFramesFolderCompleted
+from movifex.pipelines.visual_features.packets import PACKET_FORMATS, listPacketFiles
 
 def initFramesFoldersForShotDetection(configs: dict):
     """
@@ -38,6 +40,14 @@ def initFramesFoldersForShotDetection(configs: dict):
     print(f"Processing the input frames directory. Supported frame formats are {imageTypes} ...")
     # Get the list of movie folders in the root directory
     for frameFolder in glob(f'{movieFramesRootDir}/*/'):
+        # Skip the movies whose frame extraction is interrupted (or still running)
+        if not isFramesFolderCompleted(frameFolder):
+            print(f"- Skipping '{frameFolder}', as its frame extraction is not completed!")
+            continue
+        # Frames packed into shards
+        if isShardedFramesFolder(frameFolder):
+            framesFolders.append(frameFolder)
+            continue
         for imageType in imageTypes:
             if glob(f'{frameFolder}*.{imageType}'):
                 framesFolders.append(frameFolder)
@@ -79,10 +89,10 @@ def initFeaturesFoldersForShotDetection(configs: dict):
         os.mkdir(shotFeaturesRootDir)
         print(f"Selected shot features will be saved in '{shotFeaturesRootDir}' ...")
     # Check the supported feature types
-    print(f"Processing the input features directory. Supported feature format is 'json' ...")
+    print(f"Processing the input features directory. Supported feature formats are {PACKET_FORMATS} ...")
     # Get the list of movie folders in the root directory
     for featureFolder in glob(f'{movieFeaturesRootDir}/*/'):
-        if glob(f'{featureFolder}*.json'):
+        if listPacketFiles(featureFolder):
             featuresFolders.append(featureFolder)
     # Inform the user about the number of feature folders to process
     if len(featuresFolders) == 0:
@@ -123,85 +133,145 @@ def initShotsFolder(featuresDir: str, outputDir: str):
         os.mkdir(generatedPath)
         return generatedPath
 
-def mergePacketsIntoDataFrame(packetsFolder: str):
+def calculateFeaturesCosineSimilarity(movieId: str, features: np.ndarray):
     """
-    Merges all the visual features in JSON files into a single DataFrame
+    Calculates the cosine similarity between sequential features of a given feature-set, in a single vectorized pass
 
     Parameters
     ----------
-    packetsFolder : str
-        Path to the folder containing the JSON files (packets) of extracted visual features
+    movieId : str
+        The movie identifier to be used in the process
+    features : np.ndarray
+        The features matrix of the movie frames, of shape (numFrames, featureDimension), in frame-index order
 
     Returns
     -------
-    mergedDataFrame : DataFrame
-        DataFrame containing all the visual features in JSON files
+    similarities: np.ndarray
+        The float32 similarities of shape (numFrames - 1,), where similarities[i] compares the frames i and i + 1
+        (rounded to 2 decimals, NaN if either of the features is all zeros)
+    """
+    # Inform the user about the process
+    print(
+        f'- Calculating cosine similarity among sequential frames of "{movieId}" ...')
+    return calculateSequentialSimilarities(features)
 
+def calculateSequentialSimilarities(vectors: np.ndarray):
     """
-    # Variables
-    mergedDataFrame = pd.DataFrame(columns=['frameId', 'features'])
-    # Iterate over the packet files to collect them all in a single dataframe
-    for packetIdx, packetFile in enumerate(glob(f'{packetsFolder}/*.json')):
-        # Inform the user about the processing packet
-        if (packetIdx % 50 == 0):
-            print(f'-- Fetching packet #{packetIdx} ...')
-        # Reading each packet's data
-        jsonFile = open(packetFile,)
-        # Load the JSON data
-        packetData = json.load(jsonFile)
-        # Iterate on each frames of array
-        for frameData in packetData:
-            mergedDataFrame = pd.concat([mergedDataFrame, pd.DataFrame([{'frameId': frameData['frameId'], 'features': frameData['features']}])],
-                                           ignore_index=True)
-        # Close the JSON file
-        jsonFile.close()
-    return mergedDataFrame
-
-def calculateCosineSimilarity(movieId: str, featuresDF: pd.DataFrame):
+    Calculates the cosine similarity between the adjacent rows of a matrix (e.g., features or frame signatures)
+
+    Parameters
+    ----------
+    vectors : np.ndarray
+        The matrix of shape (numFrames, dimension), in frame-index order
+
+    Returns
+    -------
+    similarities: np.ndarray
+        The float32 similarities of shape (numFrames - 1,), where similarities[i] compares the rows i and i + 1
+        (rounded to 2 decimals, NaN if either of the rows is all zeros)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) < 2:
+        return np.empty(0, dtype=np.float32)
+    # Normalize the rows once, so that the similarities are the dot products of the adjacent rows
+    norms = np.linalg.norm(vectors, axis=1)
+    isZero = norms == 0
+    normalizedVectors = vectors / np.where(isZero, 1, norms)[:, None]
+    similarities = np.einsum('ij,ij->i', normalizedVectors[:-1], normalizedVectors[1:])
+    # Round the similarity values
+    similarities = np.round(similarities, 2)
+    # The similarity to an all-zeros row is undefined (never considered a shot boundary)
+    similarities[isZero[:-1] | isZero[1:]] = np.nan
+    return similarities
+
+def getSimilarityCachePath(cacheDir: str, movieId: str):
     """
-    Calculates the cosine similarity between sequential features of a given feature-set
+    Provides the path of the similarity cache (sidecar) of a movie
 
     Parameters
     ----------
+    cacheDir : str
+        The directory of the similarity caches
     movieId : str
-        The movie identifier to be used in the process
-    featuresDF : pd.DataFrame
-        The dataframe containing the visual features of the movie frames
+        The movie identifier
 
     Returns
     -------
-    similarityDF: pd.DataFrame
-        The dataframe containing the cosine similarity among sequential features
+    cachePath: str
+        The similarity cache file path (e.g., Movie.npz)
     """
-    # Variables
-    similarityDF = pd.DataFrame(
-        columns=['source', 'destination', 'similarity'])
-    # Ensure the similarityDF has a consistent data type for each column to avoid issues during concatenation
-    similarityDF['source'] = similarityDF['source'].astype('object')
-    similarityDF['destination'] = similarityDF['destination'].astype('object')
-    similarityDF['similarity'] = similarityDF['similarity'].astype('float64')
-    # Inform the user about the process
-    print(
-        f'- Calculating cosine similarity among sequential frames of "{movieId}" ...')
-    # Calculate the cosine similarity between sequential features
-    for index in range(len(featuresDF)-1):
-        # Similarity calculation
-        similarity = 1 - spatial.distance.cosine(
-            featuresDF['features'][index],
-            featuresDF['features'][index + 1])
-        # Round the similarity value
-        similarity = round(similarity, 2)
-        # Create a row for the similarity dataframe
-        row = pd.DataFrame([{
-            'source': featuresDF['frameId'][index],
-            'destination': featuresDF['frameId'][index + 1],
-            'similarity': similarity
-        }])
-        # Append the similarity to the dataframe
-        if not row.isna().all().all():
-            similarityDF = pd.concat([similarityDF, row], ignore_index=True)
-    # Return the similarity dataframe
-    return similarityDF
+    return os.path.join(cacheDir, f'{movieId}.npz')
+
+def saveSimilarityCache(cachePath: str, frameIds: np.ndarray, similarities: np.ndarray, fingerprint: str):
+    """
+    Saves the sequential similarities of a movie as a binary sidecar, along with the fingerprint of their packets
+
+    Parameters
+    ----------
+    cachePath : str
+        The similarity cache file path (.npz)
+    frameIds : np.ndarray
+        The identifiers of the frames, in frame-index order
+    similarities : np.ndarray
+        The float32 similarities among sequential features
+    fingerprint : str
+        The fingerprint of the packets the similarities are calculated from
+    """
+    # Write the complete cache before it appears under its final name
+    temporaryPath = f'{cachePath}.tmp'
+    with open(temporaryPath, 'wb') as cacheFile:
+        np.savez(cacheFile, frameIds=np.asarray(frameIds), similarities=np.asarray(similarities, dtype=np.float32),
+                 fingerprint=np.asarray(fingerprint))
+    os.replace(temporaryPath, cachePath)
+
+def loadSimilarityCache(cachePath: str, fingerprint: str):
+    """
+    Loads the cached sequential similarities of a movie, if they are calculated from the same packets
+
+    Parameters
+    ----------
+    cachePath : str
+        The similarity cache file path (.npz)
+    fingerprint : str
+        The fingerprint of the current packets of the movie
+
+    Returns
+    -------
+    cachedSimilarities: tuple
+        The (frameIds, similarities) arrays, or None if there is no cache or the packets have changed since
+    """
+    if not os.path.exists(cachePath):
+        return None
+    try:
+        with np.load(cachePath, allow_pickle=False) as cacheData:
+            if str(cacheData['fingerprint']) != fingerprint:
+                return None
+            return cacheData['frameIds'], cacheData['similarities']
+    except Exception as error:
+        print(f'- Error while reading the similarity cache "{cachePath}": {str(error)}')
+        return None
+
+def countShotsPerThreshold(similarities: np.ndarray, thresholds: list):
+    """
+    Counts the shots (middle frames between sequential shot boundaries) detected with each of the given thresholds,
+    at once (the same counts as calculateShotBoundaries)
+
+    Parameters
+    ----------
+    similarities : np.ndarray
+        The cosine similarities among sequential features
+    thresholds : list
+        The shot boundaries detection thresholds
+
+    Returns
+    -------
+    shotCounts: np.ndarray
+        The number of shots of each threshold
+    """
+    # The number of boundaries is the number of similarities less than the threshold (compared as in calculateShotBoundaries)
+    similarities = np.asarray(similarities)
+    numBoundaries = np.array([np.count_nonzero(similarities < threshold) for threshold in thresholds], dtype=np.int64)
+    return np.maximum(numBoundaries - 1, 0)
 
 def calculateCosineSimilarity(prevFrame: cv.Mat, currFrame: cv.Mat, threshold: float = 0.7):
     """
@@ -247,31 +317,124 @@ def calculateCosineSimilarity(prevFrame: cv.Mat, currFrame: cv.Mat, threshold: f
         return False
 
 
-def calculateShotBoundaries(similarityDF: pd.DataFrame, threshold: float = 0.7):
+def computeShotSignature(frame: cv.Mat, signatureSize: int = 32):
+    """
+    Computes the mean-centered grayscale signature of a frame, compared to the ones of its adjacent frames to detect shots
+    (the cosine similarity of mean-centered signatures is their correlation, in [-1, 1])
+
+    Parameters
+    ----------
+    frame : cv.Mat
+        The frame (BGR or grayscale, at any size)
+    signatureSize : int, optional
+        The width and height of the signature, by default 32
+
+    Returns
+    -------
+    signature: np.ndarray
+        The flattened float32 signature, or None if the frame has no texture (e.g., the black frames of fades)
+    """
+    signature = computeFrameSignature(frame, signatureSize)
+    if float(signature.std()) < 1.0:
+        return None
+    return signature - signature.mean()
+
+def isShotBoundary(prevSignature: np.ndarray, currSignature: np.ndarray, threshold: float):
+    """
+    Checks whether a frame starts a new shot, comparing its signature with the one of the previous (textured) frame
+
+    Parameters
+    ----------
+    prevSignature : np.ndarray
+        The signature of the previous frame, or None if there is no previous frame
+    currSignature : np.ndarray
+        The signature of the current frame
+    threshold : float
+        The similarity threshold below which a shot boundary is detected
+
+    Returns
+    -------
+    isBoundary: bool
+        True if the frame starts a new shot (the first frame always does)
+    """
+    if prevSignature is None:
+        return True
+    return bool(calculateSequentialSimilarities(np.stack([prevSignature, currSignature]))[0] < threshold)
+
+def detectFrameShotBoundaries(framesReader, threshold: float, signatureSize: int = 32, batchSize: int = 256):
     """
-    Detects shot boundaries in the similarity dataframe and returns the middle frames of the shots
+    Detects the shot boundaries of a movie from its frames, decoding them at a reduced size in grayscale and comparing
+    the small signatures of adjacent frames in batches
+        - Frames without texture (e.g., the black frames of fades) are not compared, so a cut through them is still found
 
     Parameters
     ----------
-    similarityDF : pd.DataFrame
-        The similarity dataframe containing the cosine similarity among sequential features
+    framesReader : FrameFilesReader or FrameShardReader
+        The reader of the movie frames
+    threshold : float
+        The similarity threshold below which a shot boundary is detected
+    signatureSize : int, optional
+        The width and height of the frame signatures, by default 32
+    batchSize : int, optional
+        The number of frames whose signatures are compared at once, by default 256
+
+    Returns
+    -------
+    shotFrames: list
+        The positions of the first frame of each shot, in frame-index order (the first frame of the movie included)
+    """
+    # Variables
+    shotFrames = []
+    prevPosition, prevSignature = None, None
+    batchSize = max(batchSize, 1)
+    for batchStart in range(0, len(framesReader), batchSize):
+        # Decode the frames of the batch at a quarter of their size in grayscale (JPEG frames are downscaled while decoding)
+        positions, signatures = [], []
+        for position in range(batchStart, min(batchStart + batchSize, len(framesReader))):
+            frame = decodeFrame(framesReader.readFrame(position), cv.IMREAD_REDUCED_GRAYSCALE_4)
+            if frame is None:
+                print(f'- Error reading frame "{framesReader.frameIds[position]}"! Skipping ...')
+                continue
+            signature = computeShotSignature(frame, signatureSize)
+            if signature is None:
+                continue
+            positions.append(position)
+            signatures.append(signature)
+        if not positions:
+            continue
+        # The first frame of the movie starts the first shot, and the previous batch ends with the frame to compare first
+        if prevSignature is None:
+            shotFrames.append(positions[0])
+        else:
+            positions.insert(0, prevPosition)
+            signatures.insert(0, prevSignature)
+        batchSignatures = np.stack(signatures)
+        # Compare the adjacent frames at once (a similarity below the threshold starts a new shot)
+        similarities = calculateSequentialSimilarities(batchSignatures)
+        shotFrames.extend(positions[index + 1] for index in np.flatnonzero(similarities < threshold))
+        prevPosition, prevSignature = positions[-1], batchSignatures[-1]
+    return shotFrames
+
+def calculateShotBoundaries(similarities: np.ndarray, threshold: float = 0.7):
+    """
+    Detects shot boundaries in the sequential similarities and returns the middle frames of the shots
+
+    Parameters
+    ----------
+    similarities : np.ndarray
+        The cosine similarities among sequential features (similarities[i] compares the frames i and i + 1)
+    threshold : float, optional
+        The similarity threshold below which a shot boundary is detected, by default 0.7
 
     Returns
     -------
     boundaryFrames: list
         List of the middle frames between sequential shot boundaries
     """
-    # Variables
-    boundaryFrames = []
-    print("- Calculating shot boundaries based on the similarity DataFrame ...")
-    # Filter similarityDF to only include rows with similarity less than threshold (shot boundaries)
-    boundariesDF = similarityDF[similarityDF['similarity'] < threshold]
-    # Get the index of shot boundaries
-    boundariesList = boundariesDF.index.tolist()
-    boundariesList = [int(bndry) for bndry in boundariesList]
+    print("- Calculating shot boundaries based on the sequential similarities ...")
+    # Get the index of shot boundaries (similarity less than threshold)
+    boundariesList = np.flatnonzero(np.asarray(similarities) < threshold)
     # Get the middle index of the shot boundaries
-    for item1, item2 in zip(boundariesList, boundariesList[1:]):
-        middleItem = int((item1 + item2)/2)
-        boundaryFrames.append(middleItem)
+    boundaryFrames = (boundariesList[:-1] + boundariesList[1:]) // 2
     # Return the list of keyframes
-    return boundaryFrames
\ No newline at end of file
+    return [int(boundaryFrame) for boundaryFrame in boundaryFrames]
\ No newline at end of file
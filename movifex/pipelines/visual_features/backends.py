@@ -0,0 +1,215 @@
+import os
+import numpy as np
+
+# Supported inference backends of the feature extractor
+INFERENCE_BACKENDS = ['keras', 'onnx', 'tflite']
+
+class KerasBackend:
+    """
+    Runs a (truncated) Keras model as it is, via 'model.predict'
+    """
+
+    def __init__(self, model):
+        """
+        Parameters
+        ----------
+        model: Model
+            The initialized Keras model
+        """
+        self.model = model
+
+    def predict(self, batchData: np.ndarray, verbose: int = 0):
+        return self.model.predict(batchData, verbose=verbose)
+
+class OnnxBackend:
+    """
+    Runs an exported (truncated) model with ONNX Runtime on CPU, with all graph optimizations enabled
+    """
+
+    def __init__(self, modelPath: str, intraOpThreads: int = 0, interOpThreads: int = 0):
+        """
+        Parameters
+        ----------
+        modelPath: str
+            The path of the exported ONNX model
+        intraOpThreads: int
+            The number of threads running each operation (0 for the ONNX Runtime default)
+        interOpThreads: int
+            The number of threads running independent operations (0 for the ONNX Runtime default)
+        """
+        # Imports
+        import onnxruntime
+        sessionOptions = onnxruntime.SessionOptions()
+        sessionOptions.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sessionOptions.intra_op_num_threads = intraOpThreads
+        sessionOptions.inter_op_num_threads = interOpThreads
+        self.session = onnxruntime.InferenceSession(modelPath, sess_options=sessionOptions,
+                                                    providers=['CPUExecutionProvider'])
+        self.inputName = self.session.get_inputs()[0].name
+
+    def predict(self, batchData: np.ndarray, verbose: int = 0):
+        return self.session.run(None, {self.inputName: np.asarray(batchData, dtype=np.float32)})[0]
+
+class TfliteBackend:
+    """
+    Runs an exported (truncated) model with the TensorFlow Lite interpreter on CPU
+    """
+
+    def __init__(self, modelPath: str, numThreads: int = 0):
+        """
+        Parameters
+        ----------
+        modelPath: str
+            The path of the exported TFLite model
+        numThreads: int
+            The number of threads of the interpreter (0 for the TFLite default)
+        """
+        # Imports
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_path=modelPath, num_threads=numThreads or None)
+        self.inputIndex = self.interpreter.get_input_details()[0]['index']
+        self.outputIndex = self.interpreter.get_output_details()[0]['index']
+        self.batchShape = None
+
+    def predict(self, batchData: np.ndarray, verbose: int = 0):
+        batchData = np.asarray(batchData, dtype=np.float32)
+        # Resize the input tensor only when the batch shape changes (e.g., the last partial batch)
+        if batchData.shape != self.batchShape:
+            self.interpreter.resize_tensor_input(self.inputIndex, batchData.shape)
+            self.interpreter.allocate_tensors()
+            self.batchShape = batchData.shape
+        self.interpreter.set_tensor(self.inputIndex, batchData)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.outputIndex).copy()
+
+def configureKerasThreads(intraOpThreads: int = 0, interOpThreads: int = 0):
+    """
+    Configures the number of TensorFlow threads (it has to be called before any model is built)
+
+    Parameters
+    ----------
+    intraOpThreads: int
+        The number of threads running each operation (0 for the TensorFlow default)
+    interOpThreads: int
+        The number of threads running independent operations (0 for the TensorFlow default)
+    """
+    # Imports
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intraOpThreads)
+        tf.config.threading.set_inter_op_parallelism_threads(interOpThreads)
+    except RuntimeError as error:
+        print(f'- Cannot configure the TensorFlow threads (already initialized): {str(error)}')
+
+def getExportedModelPath(exportDir: str, modelName: str, backend: str):
+    """
+    Provides the path of the exported model of the given backend
+
+    Parameters
+    ----------
+    exportDir: str
+        The directory of the exported models
+    modelName: str
+        The name of the feature extraction model (e.g., 'incp3')
+    backend: str
+        The inference backend (pick from ['onnx', 'tflite'])
+
+    Returns
+    -------
+    modelPath: str
+        The exported model path (e.g., incp3.onnx)
+    """
+    return os.path.join(exportDir, f'{modelName}.{backend}')
+
+def exportModel(model, modelPath: str, backend: str):
+    """
+    Exports a (truncated) Keras model for the given backend
+
+    Parameters
+    ----------
+    model: Model
+        The initialized Keras model
+    modelPath: str
+        The path of the exported model
+    backend: str
+        The inference backend (pick from ['onnx', 'tflite'])
+    """
+    print(f'- Exporting the model for the "{backend}" backend in "{modelPath}" ...')
+    os.makedirs(os.path.dirname(modelPath) or '.', exist_ok=True)
+    temporaryPath = f'{modelPath}.tmp'
+    if backend == 'onnx':
+        # Imports
+        import tf2onnx
+        import tensorflow as tf
+        inputSignature = [tf.TensorSpec([None] + list(model.inputs[0].shape[1:]), tf.float32, name='input')]
+        tf2onnx.convert.from_keras(model, input_signature=inputSignature, opset=13, output_path=temporaryPath)
+    else:
+        # Imports
+        import tensorflow as tf
+        # Keep the float32 weights, so that the features match the Keras ones
+        with open(temporaryPath, 'wb') as modelFile:
+            modelFile.write(tf.lite.TFLiteConverter.from_keras_model(model).convert())
+    os.replace(temporaryPath, modelPath)
+
+def initBackendModel(modelPath: str, backend: str, intraOpThreads: int = 0, interOpThreads: int = 0):
+    """
+    Loads an exported model with the given backend
+
+    Parameters
+    ----------
+    modelPath: str
+        The path of the exported model
+    backend: str
+        The inference backend (pick from ['onnx', 'tflite'])
+    intraOpThreads: int
+        The number of threads running each operation (0 for the backend default)
+    interOpThreads: int
+        The number of threads running independent operations (0 for the backend default, ignored by TFLite)
+
+    Returns
+    -------
+    backendModel: OnnxBackend or TfliteBackend
+        The loaded model, providing 'predict(batchData)'
+    """
+    if backend == 'onnx':
+        return OnnxBackend(modelPath, intraOpThreads, interOpThreads)
+    return TfliteBackend(modelPath, intraOpThreads)
+
+def checkBackendParity(referenceModel, backendModel, inputSize: int, preProcess, tolerance: float = 1e-3, numSamples: int = 4):
+    """
+    Checks whether the features of an inference backend match the Keras features within the given tolerance
+
+    Parameters
+    ----------
+    referenceModel: Model
+        The initialized Keras model
+    backendModel: OnnxBackend or TfliteBackend
+        The model of the inference backend
+    inputSize: int
+        The input size of the model
+    preProcess: function
+        The preprocess function of the model
+    tolerance: float
+        The maximum absolute difference allowed, relative to the largest Keras feature magnitude
+    numSamples: int
+        The number of random frames to compare the features of
+
+    Returns
+    -------
+    isMatching: bool
+        Whether the backend features match the Keras features
+    """
+    # Use reproducible random frames as the sample inputs
+    randomGenerator = np.random.default_rng(0)
+    batchData = preProcess(randomGenerator.integers(0, 256, (numSamples, inputSize, inputSize, 3)).astype(np.float32))
+    referenceFeatures = np.asarray(referenceModel.predict(batchData, verbose=0), dtype=np.float32)
+    backendFeatures = np.asarray(backendModel.predict(batchData), dtype=np.float32)
+    if referenceFeatures.shape != backendFeatures.shape:
+        print(f'- Parity check failed: the backend features shape {backendFeatures.shape} differs from {referenceFeatures.shape}!')
+        return False
+    maxError = float(np.abs(backendFeatures - referenceFeatures).max())
+    featuresScale = max(float(np.abs(referenceFeatures).max()), 1e-12)
+    isMatching = maxError <= tolerance * featuresScale
+    print(f'- Parity check {"passed" if isMatching else "failed"}: max absolute difference {maxError:.6f} '
+          f'(relative: {maxError / featuresScale:.6f}, tolerance: {tolerance})')
+    return isMatching
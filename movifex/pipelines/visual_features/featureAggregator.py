@@ -2,7 +2,7 @@ import os
 import time
 import numpy as np
 import pandas as pd
-from movifex.utils import loadJsonFromFilePath
+from movifex.pipelines.visual_features.packets import listPacketFiles, loadMovieFeatures
 
 def aggregateMovieFeatures(configs: dict):
     """
@@ -30,38 +30,22 @@ def aggregateMovieFeatures(configs: dict):
             print(f"-- The output file '{outputFile}' already exists! Skipping ...")
             continue
         # Otherwise, prepare variables
-        packetCounter = 0
-        movieAggFeatures = []
         movieAggFeat_Max = []
         movieAggFeat_Mean = []
         startTime = time.time()
-        numPacketFiles = len(os.listdir(featureFolder))
-        print(f"-- Aggregating {numPacketFiles} packet files ...")
-        # Iterate on all packet files in the given feature folder
-        for packetFile in os.listdir(featureFolder):
-            # Read the packet file
-            packetFilePath = os.path.join(featureFolder, packetFile)
-            # Read the packet file (JSON)
-            packetData = loadJsonFromFilePath(packetFilePath)
-            # Iterate over each item in the packet data
-            for frameData in packetData:
-                # Get the features
-                features = frameData['features']
-                features = np.array(features)
-                # Aggregate the features
-                movieAggFeatures.append(features)
-            # Increment the packet counter
-            packetCounter += 1
-            # Show progress every 50 packet files
-            if packetCounter % 50 == 0:
-                print(f"-- Aggregated {packetCounter} packet files ...")
+        packetCounter = len(listPacketFiles(featureFolder))
+        print(f"-- Aggregating {packetCounter} packet files ...")
+        # Load all packet files (JSON or binary, possibly quantized) in parallel, as a (dequantized) float32 features matrix
+        _, features = loadMovieFeatures(featureFolder, configs.get('loader_threads', 4))
+        if len(features) == 0:
+            print(f"-- No packet files found in '{featureFolder}'! Skipping ...")
+            continue
         # Aggregate the features
-        movieAggFeatures = np.array(movieAggFeatures)
         if "Max" in aggMethods:
-            movieAggFeat_Max = np.max(movieAggFeatures, axis=0)
+            movieAggFeat_Max = features.max(axis=0).astype(np.float64)
             movieAggFeat_Max = np.round(movieAggFeat_Max, 6)
         if "Mean" in aggMethods:
-            movieAggFeat_Mean = np.mean(movieAggFeatures, axis=0)
+            movieAggFeat_Mean = features.mean(axis=0, dtype=np.float64)
             movieAggFeat_Mean = np.round(movieAggFeat_Mean, 6)
         # Save the aggregated features in a dataFrame
         dataFrame = pd.DataFrame(columns=aggMethods)
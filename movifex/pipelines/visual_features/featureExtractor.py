@@ -1,9 +1,121 @@
 import os
-from movifex.pipelines.visual_features.models.vgg19 import initModelVgg19
-from movifex.pipelines.visual_features.models.inception3 import initModelInception3
-from movifex.pipelines.visual_features.utils import initFeaturesFolder, modelRunner
+from movifex.pipelines.frames.utils import normalizeVideoName
+from movifex.pipelines.visual_features.models.registry import getModelEntry
+from movifex.pipelines.visual_features.packets import checkPacketStorage
+from movifex.pipelines.visual_features.utils import getFeatureExtractorModelNames, getModelVariables, initModelsFeaturesFolders, modelRunner, videoRunner
+from movifex.pipelines.visual_features.backends import INFERENCE_BACKENDS, KerasBackend, configureKerasThreads, getExportedModelPath, exportModel, initBackendModel, checkBackendParity
 
-def extractMovieFeatures(configs: dict, movieFramesPaths: list):
+def initFeatureExtractorModel(modelName: str):
+    """
+    Initializes the given feature extraction model
+
+    Parameters
+    ----------
+    modelName :str
+        The name of the feature extraction model (e.g., 'incp3')
+
+    Returns
+    -------
+    model: Model
+        The initialized model (None if the model is not supported or cannot be initialized)
+    """
+    # Check the feature extraction model
+    modelEntry = getModelEntry(modelName)
+    if modelEntry is None:
+        return
+    model = modelEntry['initModel']()
+    # Check the model
+    if not model:
+        print(f"Error while initializing the feature extraction model '{modelName}'! Exiting ...")
+        return
+    return model
+
+def initInferenceModel(modelName: str, configs: dict):
+    """
+    Initializes the given feature extraction model for the configured inference backend
+        - The 'keras' backend runs the Keras model as it is
+        - The 'onnx' and 'tflite' backends run the exported model (exported from the Keras model on the first run)
+
+    Parameters
+    ----------
+    modelName :str
+        The name of the feature extraction model (e.g., 'incp3')
+    configs :dict
+        The configurations dictionary
+
+    Returns
+    -------
+    model: KerasBackend, OnnxBackend or TfliteBackend
+        The initialized model providing 'predict(batchData)' (None if it cannot be initialized)
+    """
+    backend = configs.get('inference_backend', 'keras')
+    if backend == 'keras':
+        kerasModel = initFeatureExtractorModel(modelName)
+        return KerasBackend(kerasModel) if kerasModel else None
+    modelPath = getExportedModelPath(configs['exported_models_path'], modelName, backend)
+    parityCheck = configs.get('parity_check', True)
+    # The Keras model is only built to export the model (on the first run) or to check the parity of the features
+    kerasModel = None
+    if parityCheck or not os.path.exists(modelPath):
+        kerasModel = initFeatureExtractorModel(modelName)
+        if not kerasModel:
+            return
+    try:
+        if not os.path.exists(modelPath):
+            exportModel(kerasModel, modelPath, backend)
+        print(f"- Loading the exported '{modelName}' model for the '{backend}' backend ...")
+        backendModel = initBackendModel(modelPath, backend, configs.get('intra_op_threads', 0), configs.get('inter_op_threads', 0))
+    except ImportError as error:
+        print(f"The '{backend}' backend needs optional packages that are not installed ({str(error)})! "
+              f"Install them (e.g., 'pip install onnxruntime tf2onnx') or pick the 'keras' backend. Exiting ...")
+        return
+    except Exception as error:
+        print(f"Error while initializing the '{backend}' backend for '{modelName}': {str(error)}! Exiting ...")
+        return
+    # Check whether the backend features match the Keras ones
+    if parityCheck:
+        modelInputSize, modelPreprocess = getModelVariables(modelName)
+        if not checkBackendParity(kerasModel, backendModel, modelInputSize, modelPreprocess, configs.get('parity_tolerance', 1e-3)):
+            print(f"The '{backend}' features of '{modelName}' do not match the Keras features! Exiting ...")
+            return
+    return backendModel
+
+def initFeatureExtractorModels(modelNames: list, configs: dict):
+    """
+    Initializes the given feature extraction models for the configured inference backend
+
+    Parameters
+    ----------
+    modelNames :list
+        The names of the feature extraction models (e.g., ['incp3', 'vgg19'])
+    configs :dict
+        The configurations dictionary
+
+    Returns
+    -------
+    models: dict
+        The initialized models by model name (None if any of the models cannot be initialized)
+    """
+    backend = configs.get('inference_backend', 'keras')
+    if backend not in INFERENCE_BACKENDS:
+        print(f"Inference backend '{backend}' is not supported! Exiting ...")
+        return
+    # Configure the TensorFlow threads before building any Keras model
+    if configs.get('intra_op_threads', 0) > 0 or configs.get('inter_op_threads', 0) > 0:
+        configureKerasThreads(configs.get('intra_op_threads', 0), configs.get('inter_op_threads', 0))
+    models = {}
+    for modelName in modelNames:
+        modelEntry = getModelEntry(modelName)
+        if modelEntry is None:
+            return
+        model = initInferenceModel(modelName, configs)
+        if not model:
+            return
+        print(f"- Model '{modelName}' is ready ({modelEntry['inputSize']}px inputs, {modelEntry['dimension']}-d features)")
+        models[modelName] = model
+    return models
+
+def extractMovieFeatures(configs: dict, movieFramesPaths: list, models: dict = None):
     """
     Extracts features from the given set of extracted movie frames
 
@@ -13,30 +125,62 @@ def extractMovieFeatures(configs: dict, movieFramesPaths: list):
         The configurations dictionary
     movieFramesPaths :list
         The list of movie frames paths
+    models :dict
+        The already initialized models by model name (e.g., kept loaded by a worker), or None to initialize them
     """
     print("Extracting visual features from the given set of extracted movie frames ...")
-    # Check the feature extraction model
-    model = None
-    modelName = configs['feature_extractor_model']
-    if modelName == 'incp3':
-        model = initModelInception3()
-    elif modelName == 'vgg19':
-        model = initModelVgg19()
-    else:
-        print(f"Feature extraction model '{modelName}' is not supported! Exiting ...")
+    # Check the packet format and the feature storage options
+    if not checkPacketStorage(configs):
         return
-    # Check the model
-    if not model:
-        print(f"Error while initializing the feature extraction model '{modelName}'! Exiting ...")
+    # Initialize the feature extraction models (each frame is decoded once for all of them)
+    if models is None:
+        models = initFeatureExtractorModels(getFeatureExtractorModelNames(configs), configs)
+    if not models:
         return
     # Iterate on all frame folders in the given root directory
     for framesFolder in movieFramesPaths:
-        # Preparing the output frames directory
+        # Preparing the output features directory of each model
         framesFolder = os.path.normpath(framesFolder)
         print(f"- Extracting features from the frames in '{framesFolder}' ...")
-        outputDir = initFeaturesFolder(framesFolder, configs['features_path'])
-        # Skip if the output directory already exists
-        if not outputDir:
+        outputDirs = initModelsFeaturesFolders(framesFolder, configs)
+        # Skip if the output directories already exist
+        if not outputDirs:
             continue
         # Extracting features from the frames
-        modelRunner(model, framesFolder, outputDir, configs)
+        modelRunner(models, framesFolder, outputDirs, configs)
+
+def extractMovieFeaturesFromVideos(configs: dict, moviesPaths: list, models: dict = None):
+    """
+    Extracts features directly from the given set of movie videos, without saving their frames (single-pass mode)
+
+    Parameters
+    ----------
+    configs :dict
+        The configurations dictionary
+    moviesPaths :list
+        The list of movie video paths
+    models :dict
+        The already initialized models by model name (e.g., kept loaded by a worker), or None to initialize them
+    """
+    print("Extracting visual features directly from the given set of movie videos ...")
+    # Check the packet format and the feature storage options
+    if not checkPacketStorage(configs):
+        return
+    # Initialize the feature extraction models (each frame is decoded once for all of them)
+    if models is None:
+        models = initFeatureExtractorModels(getFeatureExtractorModelNames(configs), configs)
+    if not models:
+        return
+    # Check if the output directory exists and create it if not
+    if not os.path.exists(configs['features_path']):
+        os.mkdir(configs['features_path'])
+        print(f"Output visual features will be saved in '{configs['features_path']}' ...")
+    # Iterate on all video files in the given directory
+    for videoFile in moviesPaths:
+        # Preparing the output features directory of each model (named the same as the frames folder of the movie)
+        outputDirs = initModelsFeaturesFolders(normalizeVideoName(videoFile), configs)
+        # Skip if the output directories already exist
+        if not outputDirs:
+            continue
+        # Extracting features from the decoded video frames
+        videoRunner(models, videoFile, outputDirs, configs)
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 
+# Input size (width and height) of the Inception-v3 model
+MODEL_INPUT_SIZE = 299
+
 def initModelInception3():
     """
     Initializes the Inception-v3 (GoogleNet) model for feature extraction
@@ -29,23 +32,20 @@ def initModelInception3():
         print(f'Error while processing video frames: {str(otherError)}')
         return None
 
-def getModelVariables():
+def preprocessInput(framesData):
     """
-    Provides the model variables for the VGG-19 model
-   
+    Preprocesses the given frames (or batch of frames) as expected by the model
+
+    Parameters
+    ----------
+    framesData: np.ndarray
+        The RGB frame(s) as float32 arrays
+
     Returns
     -------
-    modelInputSize: int
-        The input size for the VGG-19 model
-    modelPreprocess: function
-        The preprocess function for the VGG-19 model
+    framesData: np.ndarray
+        The preprocessed frame(s)
     """
     # Load proper imports
     from tensorflow.keras.applications.inception_v3 import preprocess_input
-
-    # Load Inception-v3 model variables
-    modelInputSize = 299  # Default input size for Inception-v3 model
-    modelPreprocess = preprocess_input
-    
-    # Return the model variables
-    return modelInputSize, modelPreprocess
\ No newline at end of file
+    return preprocess_input(framesData)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+# Input size (width and height) of the MobileNet-v2 model
+MODEL_INPUT_SIZE = 224
+
+def initModelMobileNetV2():
+    """
+    Initializes the MobileNet-v2 model for feature extraction (a lightweight backbone for throughput-bound runs)
+        - The model expects color images to have the square shape 224 x 224
+        - Running the example will load the MobileNet-v2 model and download the model weights
+
+    Returns
+    -------
+    model: Model
+        The initialized MobileNet-v2 model
+    """
+    print("- Initializing the MobileNet-v2 model for feature extraction ...")
+    try:
+        # Load MobileNet-v2 model
+        from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2
+        # Create a model without the classification layers, so that the global average pooling with 1,280 nodes will be the output layer
+        model = MobileNetV2(include_top=False, pooling='avg', input_shape=(MODEL_INPUT_SIZE, MODEL_INPUT_SIZE, 3))
+        print("- Initializing MobileNet-v2 finished. Getting ready for feature extraction ...\n")
+        # Return the model
+        return model
+    except Exception as otherError:
+        print(f'Error while initializing the MobileNet-v2 model: {str(otherError)}')
+        return None
+
+def preprocessInput(framesData):
+    """
+    Preprocesses the given frames (or batch of frames) as expected by the model
+
+    Parameters
+    ----------
+    framesData: np.ndarray
+        The RGB frame(s) as float32 arrays
+
+    Returns
+    -------
+    framesData: np.ndarray
+        The preprocessed frame(s)
+    """
+    # Load proper imports
+    from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+    return preprocess_input(framesData)
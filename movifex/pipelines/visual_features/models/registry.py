@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+from movifex.pipelines.visual_features.models.vgg19 import initModelVgg19, preprocessInput as preprocessVgg19, MODEL_INPUT_SIZE as inputSizeVgg19
+from movifex.pipelines.visual_features.models.inception3 import initModelInception3, preprocessInput as preprocessIncp3, MODEL_INPUT_SIZE as inputSizeIncp3
+from movifex.pipelines.visual_features.models.mobilenetv2 import initModelMobileNetV2, preprocessInput as preprocessMobileNetV2, MODEL_INPUT_SIZE as inputSizeMobileNetV2
+from movifex.pipelines.visual_features.models.efficientnetb0 import initModelEfficientNetB0, preprocessInput as preprocessEfficientNetB0, MODEL_INPUT_SIZE as inputSizeEfficientNetB0
+
+# The supported feature extraction models, by the name used in the configurations
+#   - initModel: the function initializing the (truncated) model
+#   - inputSize: the (square) input size of the model (defined by its module)
+#   - preprocess: the preprocess function of the model
+#   - dimension: the dimension of the extracted features
+MODEL_REGISTRY = {
+    'incp3': {'initModel': initModelInception3, 'inputSize': inputSizeIncp3, 'preprocess': preprocessIncp3, 'dimension': 2048},
+    'vgg19': {'initModel': initModelVgg19, 'inputSize': inputSizeVgg19, 'preprocess': preprocessVgg19, 'dimension': 4096},
+    'mobilenetv2': {'initModel': initModelMobileNetV2, 'inputSize': inputSizeMobileNetV2, 'preprocess': preprocessMobileNetV2, 'dimension': 1280},
+    'efficientnetb0': {'initModel': initModelEfficientNetB0, 'inputSize': inputSizeEfficientNetB0, 'preprocess': preprocessEfficientNetB0, 'dimension': 1280},
+}
+
+def getModelEntry(modelName: str):
+    """
+    Provides the registry entry of the given feature extraction model
+
+    Parameters
+    ----------
+    modelName: str
+        The name of the feature extraction model (e.g., 'incp3')
+
+    Returns
+    -------
+    modelEntry: dict
+        The entry containing the 'initModel', 'inputSize', 'preprocess' and 'dimension' keys (None if not supported)
+    """
+    modelEntry = MODEL_REGISTRY.get(modelName)
+    if modelEntry is None:
+        print(f"Feature extraction model '{modelName}' is not supported (pick from {list(MODEL_REGISTRY)})! Exiting ...")
+    return modelEntry
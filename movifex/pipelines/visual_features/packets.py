@@ -0,0 +1,561 @@
+import os
+import json
+import hashlib
+import time
+import numpy as np
+from glob import glob
+from concurrent.futures import ThreadPoolExecutor
+
+# Supported packet formats: 'json' (list of {frameId, features} records) and 'npz' (binary)
+PACKET_FORMATS = ['json', 'npz']
+# Supported storage types of the features in binary packets
+FEATURE_STORAGES = ['float32', 'float16', 'int8']
+# Supported scale (and offset) granularities of the int8 storage
+QUANTIZATION_SCALES = ['per_vector', 'per_dimension']
+
+class QuantizationErrorTracker:
+    """
+    Tracks the quantization error of the packets of a movie, checking it against the error bound of the storage type
+    """
+
+    def __init__(self):
+        self.errorBound = 0.0
+        self.maxError = 0.0
+        self.violations = 0
+
+    def update(self, errorBound: float, maxError: float):
+        """
+        Records the error bound and the measured error of a saved packet
+
+        Parameters
+        ----------
+        errorBound: float
+            The maximum absolute error the storage type guarantees for the packet
+        maxError: float
+            The measured maximum absolute error of the packet
+        """
+        self.errorBound = max(self.errorBound, errorBound)
+        self.maxError = max(self.maxError, maxError)
+        # Allow the float32 rounding of the dequantization itself
+        if maxError > errorBound * (1 + 1e-3) + 1e-6:
+            self.violations += 1
+
+    def report(self, movieName: str, storage: str):
+        """
+        Informs the user about the quantization error of the movie
+
+        Parameters
+        ----------
+        movieName: str
+            The name of the movie
+        storage: str
+            The storage type of the features
+        """
+        print(f'--- Max {storage} quantization error of "{movieName}": {self.maxError:.6f} (bound: {self.errorBound:.6f})')
+        if self.violations > 0:
+            print(f'--- [Warning] The quantization error of {self.violations} packets of "{movieName}" exceeds the bound!')
+
+def checkPacketStorage(configs: dict):
+    """
+    Checks the packet format and the feature storage options of a pipeline
+
+    Parameters
+    ----------
+    configs: dict
+        The configurations dictionary
+
+    Returns
+    -------
+    isValid: bool
+        Whether the packet format and the feature storage options are supported
+    """
+    packetFormat = configs.get('packet_format', 'json')
+    storage = configs.get('feature_storage', 'float32')
+    quantizationScale = configs.get('quantization_scale', 'per_vector')
+    if packetFormat not in PACKET_FORMATS:
+        print(f"Packet format '{packetFormat}' is not supported! Exiting ...")
+        return False
+    if storage not in FEATURE_STORAGES or quantizationScale not in QUANTIZATION_SCALES:
+        print(f"Feature storage '{storage}' ({quantizationScale}) is not supported! Exiting ...")
+        return False
+    if storage != 'float32' and packetFormat != 'npz':
+        print(f"Feature storage '{storage}' is only supported by the 'npz' packet format! Exiting ...")
+        return False
+    return True
+
+def getPacketPath(targetPath: str, packetIndex: int, packetFormat: str = 'json'):
+    """
+    Provides the file path of a packet
+
+    Parameters
+    ----------
+    targetPath: str
+        The directory of the packets
+    packetIndex: int
+        The index of the packet
+    packetFormat: str
+        The packet format (e.g., 'npz')
+
+    Returns
+    -------
+    packetPath: str
+        The packet file path (e.g., packet0001.npz)
+    """
+    return os.path.join(targetPath, 'packet{0:04d}.{1}'.format(packetIndex, packetFormat))
+
+def listPacketFiles(packetsFolder: str):
+    """
+    Lists the packet files of a movie in packet-index order, whatever their format is
+
+    Parameters
+    ----------
+    packetsFolder: str
+        The directory of the packets
+
+    Returns
+    -------
+    packetFiles: list
+        The sorted list of the packet file paths
+    """
+    packetFiles = []
+    for packetFormat in PACKET_FORMATS:
+        packetFiles.extend(glob(os.path.join(packetsFolder, f'*.{packetFormat}')))
+    # Zero-padded packet names keep the order when sorted
+    packetFiles.sort(key=os.path.basename)
+    return packetFiles
+
+def getPacketsFingerprint(packetsFolder: str):
+    """
+    Provides a fingerprint of the packets of a movie, changing whenever a packet is added, removed or rewritten
+
+    Parameters
+    ----------
+    packetsFolder: str
+        The directory of the packets
+
+    Returns
+    -------
+    fingerprint: str
+        The SHA-1 digest of the names, sizes and modification times of the packet files
+    """
+    packetsDigest = hashlib.sha1()
+    for packetPath in listPacketFiles(packetsFolder):
+        packetStat = os.stat(packetPath)
+        packetsDigest.update(f'{os.path.basename(packetPath)}:{packetStat.st_size}:{packetStat.st_mtime_ns};'.encode())
+    return packetsDigest.hexdigest()
+
+def getFeaturesIndexPath(packetsFolder: str):
+    """
+    Provides the path of the features index of a movie, listing the saved packets and the frames they contain
+
+    Parameters
+    ----------
+    packetsFolder: str
+        The directory of the packets
+
+    Returns
+    -------
+    indexPath: str
+        The features index file path
+    """
+    return os.path.join(packetsFolder, 'features.idx')
+
+def appendFeaturesIndex(packetsFolder: str, packetName: str, frameIds: list):
+    """
+    Records a saved packet and its frames in the features index of a movie (one line per packet)
+
+    Parameters
+    ----------
+    packetsFolder: str
+        The directory of the packets
+    packetName: str
+        The file name of the saved packet (e.g., packet0001.npz), or 'completed' to mark the extraction as completed
+    frameIds: list
+        The identifiers of the frames in the packet
+    """
+    with open(getFeaturesIndexPath(packetsFolder), 'a') as indexFile:
+        indexFile.write(' '.join([packetName, str(len(frameIds))] + [str(frameId) for frameId in frameIds]) + '\n')
+        indexFile.flush()
+        os.fsync(indexFile.fileno())
+
+def loadFeaturesIndex(packetsFolder: str):
+    """
+    Loads the features index of a movie, recovering the packets saved without being indexed (e.g., by an interrupted
+    run or before the index existed) from the packet files
+
+    Parameters
+    ----------
+    packetsFolder: str
+        The directory of the packets
+
+    Returns
+    -------
+    featuresIndex: dict
+        The 'frameIds' (set of the frames having features), 'lastPacketIndex' (0 if there is no packet) and
+        'completed' (whether the extraction is marked as completed) of the movie
+    """
+    featuresIndex = {'frameIds': set(), 'lastPacketIndex': 0, 'completed': False}
+    if not os.path.exists(packetsFolder):
+        return featuresIndex
+    indexedPackets = set()
+    indexPath = getFeaturesIndexPath(packetsFolder)
+    if os.path.exists(indexPath):
+        with open(indexPath, 'r') as indexFile:
+            for line in indexFile:
+                fields = line.split()
+                # Skip partially written lines
+                if len(fields) < 2 or not fields[1].isdigit() or len(fields) != int(fields[1]) + 2:
+                    continue
+                if fields[0] == 'completed':
+                    featuresIndex['completed'] = True
+                # Skip the packets removed since they were indexed (their frames are extracted again)
+                elif os.path.exists(os.path.join(packetsFolder, fields[0])):
+                    indexedPackets.add(fields[0])
+                    featuresIndex['frameIds'].update(fields[2:])
+    for packetPath in listPacketFiles(packetsFolder):
+        packetName = os.path.basename(packetPath)
+        packetIndex = os.path.splitext(packetName)[0][len('packet'):]
+        if packetIndex.isdigit():
+            featuresIndex['lastPacketIndex'] = max(featuresIndex['lastPacketIndex'], int(packetIndex))
+        if packetName in indexedPackets:
+            continue
+        # Index the packet, so that it is not read again on the next run
+        try:
+            frameIds, features, header = loadPacket(packetPath)
+            frameIds, _ = expandRepresentedFrames(frameIds, features, header)
+        except Exception as error:
+            print(f'- Error while reading the packet "{packetPath}" (its frames are extracted again): {str(error)}')
+            continue
+        appendFeaturesIndex(packetsFolder, packetName, frameIds)
+        featuresIndex['frameIds'].update(str(frameId) for frameId in frameIds)
+    return featuresIndex
+
+def quantizeFeatures(features: np.ndarray, storage: str = 'float32', quantizationScale: str = 'per_vector'):
+    """
+    Quantizes a features matrix for storage, and measures the error of the quantization
+
+    Parameters
+    ----------
+    features: np.ndarray
+        The float32 features matrix of shape (numFrames, featureDimension)
+    storage: str
+        The storage type (pick from ['float32', 'float16', 'int8'])
+    quantizationScale: str
+        The granularity of the int8 scale and offset (pick from ['per_vector', 'per_dimension'])
+
+    Returns
+    -------
+    quantizedData: dict
+        The arrays to be stored: 'features' (and 'scale' and 'offset' for int8)
+    errorBound: float
+        The maximum absolute error the storage type guarantees for the given features
+    maxError: float
+        The measured maximum absolute error of the dequantized features against the original ones
+    """
+    if storage == 'float16':
+        quantizedData = {'features': features.astype(np.float16)}
+        # Half precision keeps 11 significant bits (relative rounding error of 2^-11)
+        errorBound = float(np.abs(features).max(initial=0.0)) * 2.0 ** -11
+    elif storage == 'int8':
+        # Map the [min, max] range of each vector (or dimension) to the 256 levels of int8
+        axis = 1 if quantizationScale == 'per_vector' else 0
+        offset = features.min(axis=axis, keepdims=True)
+        scale = (features.max(axis=axis, keepdims=True) - offset) / 255.0
+        # Rounding to the nearest level costs at most half a step
+        errorBound = float(scale.max(initial=0.0)) / 2.0
+        # Constant vectors (or dimensions) are exactly represented by their offset
+        scale[scale == 0] = 1.0
+        levels = np.clip(np.rint((features - offset) / scale), 0, 255)
+        quantizedData = {'features': (levels - 128).astype(np.int8), 'scale': scale.astype(np.float32),
+                         'offset': offset.astype(np.float32)}
+    else:
+        quantizedData = {'features': features}
+        errorBound = 0.0
+    maxError = float(np.abs(dequantizeFeatures(quantizedData) - features).max(initial=0.0))
+    return quantizedData, errorBound, maxError
+
+def dequantizeFeatures(quantizedData):
+    """
+    Dequantizes the stored features of a packet into a float32 features matrix
+
+    Parameters
+    ----------
+    quantizedData: dict or NpzFile
+        The stored arrays: 'features' (and 'scale' and 'offset' for int8)
+
+    Returns
+    -------
+    features: np.ndarray
+        The float32 features matrix
+    """
+    features = quantizedData['features']
+    if features.dtype == np.int8:
+        return (features.astype(np.float32) + 128.0) * quantizedData['scale'] + quantizedData['offset']
+    return features.astype(np.float32, copy=False)
+
+def saveBinaryPacket(packetPath: str, frameIds: list, features: np.ndarray, modelName: str = '',
+                     storage: str = 'float32', quantizationScale: str = 'per_vector', represents: list = None):
+    """
+    Saves a packet in the binary format: a contiguous features matrix, the frame ids and a small header
+
+    Parameters
+    ----------
+    packetPath: str
+        The packet file path (.npz)
+    frameIds: list
+        The identifiers of the frames in the packet
+    features: np.ndarray
+        The features matrix of shape (len(frameIds), featureDimension)
+    modelName: str
+        The name of the feature extraction model (e.g., 'incp3')
+    storage: str
+        The storage type of the features (pick from ['float32', 'float16', 'int8'])
+    quantizationScale: str
+        The granularity of the int8 scale and offset (pick from ['per_vector', 'per_dimension'])
+    represents: list
+        The frames each features vector stands for, one list per frame (None if each vector stands for its own frame)
+
+    Returns
+    -------
+    errorBound: float
+        The maximum absolute error the storage type guarantees for the packet features
+    maxError: float
+        The measured maximum absolute error of the stored features against the given float32 ones
+    """
+    features = np.ascontiguousarray(features, dtype=np.float32)
+    quantizedData, errorBound, maxError = quantizeFeatures(features, storage, quantizationScale)
+    # The represented frames are stored flattened, with the number of frames of each vector
+    if represents is not None:
+        quantizedData['representedFrameIds'] = np.asarray([frameId for representedFrameIds in represents for frameId in representedFrameIds])
+        quantizedData['representedCounts'] = np.asarray([len(representedFrameIds) for representedFrameIds in represents], dtype=np.int32)
+    # Write the complete packet before it appears under its final name
+    temporaryPath = f'{packetPath}.tmp'
+    with open(temporaryPath, 'wb') as packetFile:
+        np.savez(packetFile, frameIds=np.asarray(frameIds), model=np.asarray(modelName or ''),
+                 dim=np.asarray(features.shape[1], dtype=np.int32), storage=np.asarray(storage),
+                 errorBound=np.asarray(errorBound, dtype=np.float32), **quantizedData)
+    os.replace(temporaryPath, packetPath)
+    return errorBound, maxError
+
+def readBinaryPacket(packetFile):
+    """
+    Reads a packet saved in the binary format, dequantizing its features
+
+    Parameters
+    ----------
+    packetFile: str or io.BytesIO
+        The packet file path or content
+
+    Returns
+    -------
+    frameIds: list
+        The identifiers of the frames in the packet
+    features: np.ndarray
+        The float32 features matrix of shape (len(frameIds), featureDimension)
+    header: dict
+        The header of the packet, containing the 'model', 'dim', 'storage', 'errorBound' and 'represents' keys
+    """
+    with np.load(packetFile, allow_pickle=False) as packetData:
+        header = {'model': str(packetData['model']), 'dim': int(packetData['dim']),
+                  'storage': str(packetData['storage']) if 'storage' in packetData.files else 'float32',
+                  'errorBound': float(packetData['errorBound']) if 'errorBound' in packetData.files else 0.0,
+                  'represents': None}
+        if 'representedCounts' in packetData.files:
+            splitPoints = np.cumsum(packetData['representedCounts'])[:-1]
+            header['represents'] = [representedFrameIds.tolist() for representedFrameIds in np.split(packetData['representedFrameIds'], splitPoints)]
+        return packetData['frameIds'].tolist(), dequantizeFeatures(packetData), header
+
+def readJsonPacket(packetData: list):
+    """
+    Converts the records of a JSON packet into the frame ids and the features matrix
+
+    Parameters
+    ----------
+    packetData: list
+        The list of {'frameId', 'features'} records of the packet (and 'represents', if the packet is sparse)
+
+    Returns
+    -------
+    frameIds: list
+        The identifiers of the frames in the packet
+    features: np.ndarray
+        The float32 features matrix of shape (len(frameIds), featureDimension)
+    header: dict
+        The header of the packet, containing the 'model' (unknown for JSON packets), 'dim', 'storage', 'errorBound' and
+        'represents' keys
+    """
+    frameIds = [frameData['frameId'] for frameData in packetData]
+    features = np.array([frameData['features'] for frameData in packetData], dtype=np.float32)
+    if features.ndim != 2:
+        features = features.reshape(len(frameIds), -1)
+    represents = None
+    if any('represents' in frameData for frameData in packetData):
+        represents = [frameData.get('represents') or [frameData['frameId']] for frameData in packetData]
+    return frameIds, features, {'model': '', 'dim': features.shape[1], 'storage': 'float32', 'errorBound': 0.0, 'represents': represents}
+
+def loadPacket(packetPath: str):
+    """
+    Loads a packet of extracted features, whatever its format is
+
+    Parameters
+    ----------
+    packetPath: str
+        The packet file path (.json or .npz)
+
+    Returns
+    -------
+    frameIds: list
+        The identifiers of the frames in the packet
+    features: np.ndarray
+        The float32 features matrix of shape (len(frameIds), featureDimension)
+    header: dict
+        The header of the packet, containing the 'model', 'dim', 'storage', 'errorBound' and 'represents' keys
+    """
+    if packetPath.endswith('.npz'):
+        return readBinaryPacket(packetPath)
+    with open(packetPath, 'r') as jsonFile:
+        return readJsonPacket(json.load(jsonFile))
+
+def packetToRecords(frameIds: list, features: np.ndarray, represents: list = None):
+    """
+    Converts a packet into the list of {'frameId', 'features'} records of the JSON packets
+
+    Parameters
+    ----------
+    frameIds: list
+        The identifiers of the frames in the packet
+    features: np.ndarray
+        The features matrix of the packet
+    represents: list
+        The frames each features vector stands for (None if each vector stands for its own frame)
+
+    Returns
+    -------
+    packetData: list
+        The list of {'frameId', 'features'} records (and 'represents', if given)
+    """
+    if represents is not None:
+        return [{'frameId': frameId, 'features': frameFeatures, 'represents': representedFrameIds}
+                for frameId, frameFeatures, representedFrameIds in zip(frameIds, features.tolist(), represents)]
+    return [{'frameId': frameId, 'features': frameFeatures} for frameId, frameFeatures in zip(frameIds, features.tolist())]
+
+def expandRepresentedFrames(frameIds: list, features: np.ndarray, header: dict):
+    """
+    Expands the features of a sparse packet (extracted for the representative frames of the shots) into one row per
+    represented frame, so that a sparse packet reads like a dense one
+
+    Parameters
+    ----------
+    frameIds: list
+        The identifiers of the frames in the packet
+    features: np.ndarray
+        The features matrix of the packet
+    header: dict
+        The header of the packet, containing the 'represents' key
+
+    Returns
+    -------
+    frameIds: list
+        The identifiers of the represented frames (the given ones, if the packet is not sparse)
+    features: np.ndarray
+        The features matrix with a row per represented frame
+    """
+    represents = header.get('represents')
+    if represents is None:
+        return frameIds, features
+    representedCounts = [len(representedFrameIds) for representedFrameIds in represents]
+    return [frameId for representedFrameIds in represents for frameId in representedFrameIds], np.repeat(features, representedCounts, axis=0)
+
+def loadMovieFeatures(packetsFolder: str, numWorkers: int = 4):
+    """
+    Loads all the packets (JSON or binary) of a movie at once, parsing them in a pool of threads
+
+    Parameters
+    ----------
+    packetsFolder: str
+        The directory of the packets
+    numWorkers: int
+        The number of threads parsing the packets (0 to parse them in the calling thread)
+
+    Returns
+    -------
+    frameIds: np.ndarray
+        The identifiers of the frames, in frame-index order (the frames represented by the sparse packets included)
+    features: np.ndarray
+        The contiguous float32 features matrix of shape (len(frameIds), featureDimension), in the same order
+    """
+    packetFiles = listPacketFiles(packetsFolder)
+    if numWorkers > 0 and len(packetFiles) > 1:
+        with ThreadPoolExecutor(max_workers=numWorkers) as executor:
+            packets = list(executor.map(loadPacket, packetFiles))
+    else:
+        packets = [loadPacket(packetFile) for packetFile in packetFiles]
+    packets = [expandRepresentedFrames(*packet) for packet in packets]
+    packets = [(packetFrameIds, packetFeatures) for packetFrameIds, packetFeatures in packets if len(packetFrameIds) > 0]
+    if not packets:
+        return np.array([], dtype=str), np.empty((0, 0), dtype=np.float32)
+    frameIds = np.array([frameId for packetFrameIds, _ in packets for frameId in packetFrameIds])
+    features = np.concatenate([packetFeatures for _, packetFeatures in packets], axis=0)
+    # Packets appended by an incremental extraction may contain earlier frames, so restore the frame-index order
+    if np.any(frameIds[1:] < frameIds[:-1]):
+        frameOrder = np.argsort(frameIds, kind='stable')
+        frameIds, features = frameIds[frameOrder], features[frameOrder]
+    return frameIds, np.ascontiguousarray(features, dtype=np.float32)
+
+def convertJsonPackets(configs: dict):
+    """
+    Converts the JSON packets of a tree of extracted movie features (one folder per movie) into binary packets
+
+    Parameters
+    ----------
+    configs: dict
+        The configurations dictionary
+    """
+    print("Converting the JSON packets of the given set of extracted movie features into binary packets ...")
+    # Variables
+    rootDir = os.path.normpath(configs['features_path'])
+    outputRootDir = os.path.normpath(configs['converted_features_path'])
+    modelName = configs.get('feature_extractor_model', '')
+    storage = configs.get('feature_storage', 'float32')
+    quantizationScale = configs.get('quantization_scale', 'per_vector')
+    if not checkPacketStorage(dict(configs, packet_format='npz')):
+        return
+    if not os.path.exists(rootDir):
+        print(f"Input movie features root directory '{rootDir}' does not exist! Exiting ...")
+        return
+    if not os.path.exists(outputRootDir):
+        os.mkdir(outputRootDir)
+    # Iterate on all feature folders in the given root directory
+    for featureFolder in sorted(glob(f'{rootDir}/*/')):
+        featureFolder = os.path.normpath(featureFolder)
+        folderName = os.path.basename(featureFolder)
+        outputDir = os.path.join(outputRootDir, folderName)
+        if not os.path.exists(outputDir):
+            os.mkdir(outputDir)
+        # Variables
+        inputBytes = 0
+        outputBytes = 0
+        convertedPackets = 0
+        errorTracker = QuantizationErrorTracker()
+        startTime = time.time()
+        for packetPath in sorted(glob(os.path.join(featureFolder, '*.json'))):
+            # Skip the packets converted before (e.g., by an interrupted run)
+            binaryPacketPath = os.path.splitext(os.path.join(outputDir, os.path.basename(packetPath)))[0] + '.npz'
+            if os.path.exists(binaryPacketPath):
+                continue
+            try:
+                frameIds, features, header = loadPacket(packetPath)
+                errorTracker.update(*saveBinaryPacket(binaryPacketPath, frameIds, features, modelName, storage, quantizationScale,
+                                                      header['represents']))
+            except Exception as error:
+                print(f'- Error while converting the packet "{packetPath}": {str(error)}')
+                continue
+            inputBytes += os.path.getsize(packetPath)
+            outputBytes += os.path.getsize(binaryPacketPath)
+            convertedPackets += 1
+        # Inform the user
+        elapsedTime = '{:.2f}'.format(time.time() - startTime)
+        sizeRatio = '{:.2f}'.format(inputBytes / outputBytes) if outputBytes > 0 else '-'
+        print(f'- Converted {convertedPackets} packets of "{folderName}" in {elapsedTime} seconds (JSON/binary size ratio: {sizeRatio})!')
+        if storage != 'float32':
+            errorTracker.report(folderName, storage)
@@ -1,12 +1,21 @@
+import io
 import os
 import time
 import string
 import numpy as np
+import cv2 as cv
 import pandas as pd
 from glob import glob
+from itertools import islice
+from collections import deque
 from pandas.core.frame import DataFrame
-from movifex.pipelines.visual_features.models.vgg19 import getModelVariables as getVgg19Variables
-from movifex.pipelines.visual_features.models.inception3 import getModelVariables as getIncp3Variables
+from concurrent.futures import ThreadPoolExecutor
+from movifex.pipelines.frames.frameReader import openMovieFrames, isShardedFramesFolder
+from movifex.pipelines.frames.frameManifest import isFramesFolderCompleted, loadDuplicateFrames
+from movifex.pipelines.frames.utils import getFramePickingRate, sampleVideoFrames
+from movifex.pipelines.shots.utils import detectFrameShotBoundaries
+from movifex.pipelines.visual_features.packets import getPacketPath, saveBinaryPacket, QuantizationErrorTracker, appendFeaturesIndex, loadFeaturesIndex
+from movifex.pipelines.visual_features.models.registry import getModelEntry
 
 def initMovieFramesFolders(configs: dict):
     """
@@ -39,6 +48,14 @@ def initMovieFramesFolders(configs: dict):
     print(f"Processing the input frames directory. Supported frame formats are {imageTypes} ...")
     # Get the list of movie folders in the root directory
     for frameFolder in glob(f'{movieFramesRootDir}/*/'):
+        # Skip the movies whose frame extraction is interrupted (or still running)
+        if not isFramesFolderCompleted(frameFolder):
+            print(f"- Skipping '{frameFolder}', as its frame extraction is not completed!")
+            continue
+        # Frames packed into shards
+        if isShardedFramesFolder(frameFolder):
+            framesFolders.append(frameFolder)
+            continue
         for imageType in imageTypes:
             if glob(f'{frameFolder}*.{imageType}'):
                 framesFolders.append(frameFolder)
@@ -51,7 +68,7 @@ def initMovieFramesFolders(configs: dict):
     # Return the list of video files
     return framesFolders
 
-def initFeaturesFolder(framesDir: str, featuresDir: str):
+def initFeaturesFolder(framesDir: str, featuresDir: str, incremental: bool = False):
     """
     Pre-checks and generates the output visual features folder
 
@@ -61,6 +78,8 @@ def initFeaturesFolder(framesDir: str, featuresDir: str):
         The frames folder address to extract visual features from
     featuresDir: str
         The visual features directory to save the extracted features
+    incremental: bool
+        Whether an existing output folder is continued (extracting only its missing frames) instead of being skipped
     
     Returns
     -------
@@ -73,6 +92,10 @@ def initFeaturesFolder(framesDir: str, featuresDir: str):
     folderName = string.capwords(folderName.replace("_", "")).replace(" ", "")
     # Creating output folder
     generatedPath = os.path.join(featuresDir, folderName)
+    # Continue the existing output folder of the movie, appending the features of its missing frames
+    if os.path.exists(generatedPath) and incremental:
+        print(f'- Continuing {folderName} in its existing output folder ...')
+        return generatedPath
     # Do not re-generate features for movie frames if there is a folder with their normalized name
     if os.path.exists(generatedPath):
         print(
@@ -82,42 +105,317 @@ def initFeaturesFolder(framesDir: str, featuresDir: str):
         os.mkdir(generatedPath)
         return generatedPath
 
-def featureExtractor(imageFile, model, preProcess, inputSize: int):
+def getFeatureExtractorModelNames(configs: dict):
     """
-    Pre-checks and generates the output visual features folder
+    Provides the names of the feature extraction models of a pipeline ('feature_extractor_model' is a name or a list)
+
+    Parameters
+    ----------
+    configs: dict
+        The configurations dictionary
+
+    Returns
+    -------
+    modelNames: list
+        The names of the feature extraction models (e.g., ['incp3', 'vgg19'])
+    """
+    modelNames = configs['feature_extractor_model']
+    return list(modelNames) if isinstance(modelNames, list) else [modelNames]
+
+def initModelsFeaturesFolders(framesDir: str, configs: dict):
+    """
+    Pre-checks and generates the output visual features folder of a movie for each feature extraction model
+        - A single model saves its features in 'features_path/<Movie>'
+        - A list of models saves their features in parallel trees 'features_path/<model>/<Movie>'
 
     Parameters
     ----------
     framesDir: str
-        The frames folder address to extract visual features from
-    featuresDir: str
-        The visual features directory to save the extracted features
-    
+        The frames folder (or video file) address to extract visual features from
+    configs: dict
+        The configurations dictionary
+
     Returns
     -------
-    videoFiles: list
-        A list of fetched video files
+    outputDirs: dict
+        The generated output folder of each model, by model name (models whose folder already exists are skipped,
+        unless the extraction is incremental)
+    """
+    outputDirs = {}
+    featuresDir = configs['features_path']
+    incremental = configs.get('incremental_extraction', True)
+    isMultiModel = isinstance(configs['feature_extractor_model'], list)
+    for modelName in getFeatureExtractorModelNames(configs):
+        modelFeaturesDir = os.path.join(featuresDir, modelName) if isMultiModel else featuresDir
+        if not os.path.exists(modelFeaturesDir):
+            os.makedirs(modelFeaturesDir)
+        outputDir = initFeaturesFolder(framesDir, modelFeaturesDir, incremental)
+        if outputDir:
+            outputDirs[modelName] = outputDir
+    return outputDirs
+
+def loadFrameImage(imageFile):
+    """
+    Loads (decodes) a saved frame as an RGB image, so that it can be resized for several models
+
+    Parameters
+    ----------
+    imageFile: str or io.BytesIO
+        The frame file path, or the encoded frame content
+
+    Returns
+    -------
+    image: PIL.Image
+        The decoded frame, or None if it cannot be loaded
     """
     # Imports
-    from tensorflow.keras.preprocessing.image import load_img, img_to_array
-    # Variables
-    features = None
+    from tensorflow.keras.preprocessing.image import load_img
+    try:
+        # Extracting the content of the image
+        return load_img(imageFile)
+    except Exception as error:
+        print(f'- Error while loading the frame "{imageFile}": {str(error)}')
+        return None
+
+def resizeFrameImage(image, inputSize: int):
+    """
+    Resizes a decoded frame to the input size of a model (the same way as 'load_img' with a target size)
+
+    Parameters
+    ----------
+    image: PIL.Image
+        The decoded frame
+    inputSize: int
+        The input size of the model
+
+    Returns
+    -------
+    frameData: np.ndarray
+        The frame as a float32 array of shape (inputSize, inputSize, 3)
+    """
+    # Imports
+    from PIL import Image
+    from tensorflow.keras.preprocessing.image import img_to_array
+    if image.size != (inputSize, inputSize):
+        image = image.resize((inputSize, inputSize), Image.NEAREST)
+    # Convert the image pixels to a numpy array
+    return img_to_array(image)
+
+def loadFrameData(imageFile, inputSize: int):
+    """
+    Loads a saved frame as a model input
+
+    Parameters
+    ----------
+    imageFile: str or io.BytesIO
+        The frame file path, or the encoded frame content
+    inputSize: int
+        The input size of the model
+
+    Returns
+    -------
+    frameData: np.ndarray
+        The frame as a float32 array of shape (inputSize, inputSize, 3), or None if it cannot be loaded
+    """
+    image = loadFrameImage(imageFile)
+    if image is None:
+        return None
+    return resizeFrameImage(image, inputSize)
+
+def featureExtractor(imageFile, model, preProcess, inputSize: int):
+    """
+    Extracts the visual features of a given frame using the given model
+
+    Parameters
+    ----------
+    imageFile: str or io.BytesIO
+        The frame file path, or the encoded frame content
+    model: Model
+        The initialized model for feature extraction
+    preProcess: function
+        The preprocess function of the model
+    inputSize: int
+        The input size of the model
+    
+    Returns
+    -------
+    features: np.ndarray
+        The extracted features (None if the extraction fails)
+    """
     try:
         # Extracting the content of the image
-        imageContent = load_img(imageFile, target_size=(inputSize, inputSize))
-        # Convert the image pixels to a numpy array
-        frameData = img_to_array(imageContent)
-        frameData = np.expand_dims(frameData, axis=0)
-        # Preprocessing
-        frameData = preProcess(frameData)
-        # Get extracted features
-        features = model.predict(frameData)
-        # Return the extracted features
-        return features
+        frameData = loadFrameData(imageFile, inputSize)
+        if frameData is None:
+            return None
+        # Get extracted features (as a batch of one frame)
+        return batchFeatureExtractor([frameData], model, preProcess)
     except Exception as error:
         print(f'- Error while extracting the features of "{imageFile}": {str(error)}')
         return None
 
+def prepareVideoFrame(frame: cv.Mat, inputSize: int):
+    """
+    Prepares a decoded video frame as a model input in memory (instead of saving and re-loading it as an image file)
+        - The frame is directly resized to the square input, unlike the saved frames (resized keeping their aspect ratio,
+          encoded and resized again), so its features must not be mixed with the ones of the saved frames
+
+    Parameters
+    ----------
+    frame: cv.Mat
+        The decoded video frame (BGR)
+    inputSize: int
+        The input size of the model
+
+    Returns
+    -------
+    frameData: np.ndarray
+        The resized RGB frame as a float32 array of shape (inputSize, inputSize, 3)
+    """
+    # Resize the frame to the model input size
+    frameData = cv.resize(frame, (inputSize, inputSize), interpolation=cv.INTER_AREA)
+    # Convert the frame to RGB, as expected by the models
+    frameData = cv.cvtColor(frameData, cv.COLOR_BGR2RGB)
+    return frameData.astype(np.float32)
+
+def batchFeatureExtractor(framesData: list, model, preProcess):
+    """
+    Extracts the visual features of a batch of prepared frames using the given model
+
+    Parameters
+    ----------
+    framesData: list
+        The list of prepared frames, each as an array of shape (inputSize, inputSize, 3)
+    model: Model
+        The initialized model for feature extraction
+    preProcess: function
+        The preprocess function of the model (None if the frames are already preprocessed)
+
+    Returns
+    -------
+    features: np.ndarray
+        The extracted features of shape (len(framesData), featureDimension)
+    """
+    # Stack the frames into a single batch and preprocess it
+    batchData = np.stack(framesData)
+    if preProcess is not None:
+        batchData = preProcess(batchData)
+    # Get extracted features
+    return model.predict(batchData, verbose=0)
+
+def loadPreprocessedFrame(framesReader, position: int, modelsVariables: list):
+    """
+    Loads the frame at the given position of a movie once, and resizes and preprocesses it for each model
+    (runs in the prefetching threads)
+
+    Parameters
+    ----------
+    framesReader: FrameFilesReader or FrameShardReader
+        The reader of the movie frames
+    position: int
+        The position of the frame in the movie
+    modelsVariables: list
+        The (inputSize, preProcess) variables of each model
+
+    Returns
+    -------
+    framesData: list
+        The preprocessed frame of each model, or None if it cannot be loaded
+    """
+    try:
+        encodedFrame = framesReader.readFrame(position)
+    except OSError as error:
+        print(f'- Error while reading "{framesReader.frameIds[position]}": {str(error)}')
+        return None
+    image = loadFrameImage(io.BytesIO(encodedFrame))
+    if image is None:
+        return None
+    return [preProcess(resizeFrameImage(image, inputSize)) for inputSize, preProcess in modelsVariables]
+
+def prefetchFrameBatches(framesReader, modelsVariables: list, batchSize: int, numWorkers: int = 4, depth: int = 2,
+                         positions: list = None):
+    """
+    Provides the preprocessed frame batches of a movie in frame-index order, while the next batches are loaded and
+    preprocessed in a pool of threads (so that the models do not wait for their input)
+
+    Parameters
+    ----------
+    framesReader: FrameFilesReader or FrameShardReader
+        The reader of the movie frames
+    modelsVariables: list
+        The (inputSize, preProcess) variables of each model
+    batchSize: int
+        The number of frames in each batch
+    numWorkers: int
+        The number of threads loading the frames (0 to load them in the calling thread)
+    depth: int
+        The number of batches loaded ahead of the consumed one
+    positions: list
+        The sorted positions of the frames to load (None to load all the frames of the movie)
+
+    Yields
+    ------
+    batchFrameIds: list
+        The identifiers of the frames in the batch (frames which cannot be loaded are skipped)
+    batchFramesData: list
+        The preprocessed frames of the batch, one list per model
+    """
+    def collectBatches(loadedFrames):
+        # Group the loaded frames into batches, skipping the frames which cannot be loaded
+        batchFrameIds, batchFramesData = [], [[] for _ in modelsVariables]
+        for frameId, framesData, isLast in loadedFrames:
+            if framesData is None:
+                print(f'- No features extracted! Skipping "{frameId}" ...')
+            else:
+                batchFrameIds.append(frameId)
+                for modelFramesData, frameData in zip(batchFramesData, framesData):
+                    modelFramesData.append(frameData)
+            if len(batchFrameIds) == batchSize or (isLast and batchFrameIds):
+                yield batchFrameIds, batchFramesData
+                batchFrameIds, batchFramesData = [], [[] for _ in modelsVariables]
+
+    positions = range(len(framesReader)) if positions is None else positions
+    lastPosition = positions[-1] if len(positions) > 0 else -1
+    # Load the frames in the calling thread if no prefetching is requested
+    if numWorkers <= 0:
+        yield from collectBatches((framesReader.frameIds[position], loadPreprocessedFrame(framesReader, position, modelsVariables),
+                                   position == lastPosition) for position in positions)
+        return
+
+    def loadFramesAhead(executor):
+        # Keep the frames of 'depth' batches being loaded ahead
+        positionsIterator = iter(positions)
+        pendingFrames = deque((position, executor.submit(loadPreprocessedFrame, framesReader, position, modelsVariables))
+                              for position in islice(positionsIterator, max(depth, 1) * batchSize))
+        while pendingFrames:
+            position, pendingFrame = pendingFrames.popleft()
+            # Replace the consumed frame with the next one to load
+            nextPosition = next(positionsIterator, None)
+            if nextPosition is not None:
+                pendingFrames.append((nextPosition, executor.submit(loadPreprocessedFrame, framesReader, nextPosition, modelsVariables)))
+            yield framesReader.frameIds[position], pendingFrame.result(), position == lastPosition
+
+    with ThreadPoolExecutor(max_workers=numWorkers) as executor:
+        yield from collectBatches(loadFramesAhead(executor))
+
+def getModelVariables(modelName: str):
+    """
+    Provides the input size and the preprocess function of the given feature extraction model (from the model registry)
+
+    Parameters
+    ----------
+    modelName: str
+        The name of the feature extraction model (e.g., 'incp3')
+
+    Returns
+    -------
+    modelVariables: tuple
+        The (inputSize, preProcess) variables of the model (None if the model is not supported)
+    """
+    modelEntry = getModelEntry(modelName)
+    if modelEntry is None:
+        return None
+    return modelEntry['inputSize'], modelEntry['preprocess']
+
 def featuresFileCreator(targetPath: str, fileName: str):
     """
     Creates a features file for a given movie ID and file name
@@ -156,6 +454,11 @@ def packetManager(packetIndex: int, dataFrame: DataFrame, framesFolder: str, tar
         The movie ID to save the packet for
     targetPath: str
         The target path to save the packet
+
+    Returns
+    -------
+    isSaved: bool
+        Whether the packet is saved
     """
     try:
         # Format the packet index
@@ -167,84 +470,389 @@ def packetManager(packetIndex: int, dataFrame: DataFrame, framesFolder: str, tar
         featuresFile = featuresFileCreator(targetPath, packetName)
         dataFrame.to_json(featuresFile, orient="records",
                         double_precision=6)
+        return True
     except Exception as error:
         print(f'- Error while saving the packet "{packetName}" for "{framesFolder}": {str(error)}')
+        return False
 
-def modelRunner(model, framesFolder, outputDir, configs: dict):
+class PacketBuffer:
     """
-    Pre-checks the given directory for movie frames and prepares it for further processing
+    Accumulates the extracted features of a movie in a preallocated float32 matrix and saves them as packets, once per packet
+    (instead of growing a DataFrame on every frame, which copies it on each append)
+    """
+
+    def __init__(self, packetSize: int, framesFolder: str, targetPath: str, packetIndex: int = 1,
+                 packetFormat: str = 'json', modelName: str = '', storage: str = 'float32',
+                 quantizationScale: str = 'per_vector', indexed: bool = False):
+        """
+        Parameters
+        ----------
+        packetSize: int
+            The packets size (number of frames in each packet)
+        framesFolder: str
+            The movie ID to save the packets for
+        targetPath: str
+            The target path to save the packets
+        packetIndex: int
+            The index of the next packet to be saved
+        packetFormat: str
+            The format of the saved packets ('json' or 'npz')
+        modelName: str
+            The name of the feature extraction model, recorded in the header of the binary packets
+        storage: str
+            The storage type of the features in the binary packets (pick from ['float32', 'float16', 'int8'])
+        quantizationScale: str
+            The granularity of the int8 scale and offset (pick from ['per_vector', 'per_dimension'])
+        indexed: bool
+            Whether the saved packets are recorded in the features index of the movie (for incremental extraction)
+        """
+        self.packetSize = max(packetSize, 1)
+        self.framesFolder = framesFolder
+        self.targetPath = targetPath
+        self.packetIndex = packetIndex
+        self.firstPacketIndex = packetIndex
+        self.indexed = indexed
+        self.packetFormat = packetFormat
+        self.modelName = modelName
+        self.storage = storage
+        self.quantizationScale = quantizationScale
+        self.errorTracker = QuantizationErrorTracker()
+        self.frameIds = np.empty(self.packetSize, dtype=object)
+        # The frames each buffered vector stands for (only recorded in the packets if a vector stands for other frames)
+        self.represents = [None] * self.packetSize
+        # The features matrix is allocated on the first append, once the features dimension is known
+        self.features = None
+        self.count = 0
+        self.totalFeatures = 0
+        self.failedPackets = 0
+
+    def append(self, frameId, features: np.ndarray, represents: list = None):
+        """
+        Appends the features of a frame, saving the packet once it is full
+
+        Parameters
+        ----------
+        frameId: str or int
+            The identifier of the frame (e.g., frame0000001)
+        features: np.ndarray
+            The features vector of the frame
+        represents: list
+            The frames the features vector stands for (None if it only stands for the given frame)
+        """
+        if self.features is None:
+            self.features = np.empty((self.packetSize, len(features)), dtype=np.float32)
+        self.frameIds[self.count] = frameId
+        self.features[self.count] = features
+        self.represents[self.count] = represents
+        self.count += 1
+        self.totalFeatures += 1
+        if self.count == self.packetSize:
+            self.flush()
+
+    def flush(self):
+        """
+        Saves the buffered features as a (possibly partial) packet and empties the buffer
+        """
+        if self.count == 0:
+            return
+        isSaved = False
+        frameIds = self.frameIds[:self.count].tolist()
+        packetPath = getPacketPath(self.targetPath, self.packetIndex, self.packetFormat)
+        # A sparse packet records the frames each vector stands for
+        represents = None
+        if any(representedFrameIds is not None for representedFrameIds in self.represents[:self.count]):
+            represents = [representedFrameIds or [frameId] for frameId, representedFrameIds in zip(frameIds, self.represents[:self.count])]
+        if self.packetFormat == 'npz':
+            try:
+                print(f'- Saving "{os.path.basename(packetPath)}" for "{self.framesFolder}" ...')
+                self.errorTracker.update(*saveBinaryPacket(packetPath, frameIds, self.features[:self.count], self.modelName,
+                                                           self.storage, self.quantizationScale, represents))
+                isSaved = True
+            except Exception as error:
+                print(f'- Error while saving the packet "{os.path.basename(packetPath)}" for "{self.framesFolder}": {str(error)}')
+        else:
+            packetDF = pd.DataFrame({'frameId': frameIds, 'features': list(self.features[:self.count])})
+            if represents is not None:
+                packetDF['represents'] = represents
+            isSaved = packetManager(self.packetIndex, packetDF, self.framesFolder, self.targetPath)
+        # Record the frames of the packet (all the represented ones) once it is completely saved
+        if not isSaved:
+            self.failedPackets += 1
+        elif self.indexed:
+            appendFeaturesIndex(self.targetPath, os.path.basename(packetPath),
+                                frameIds if represents is None else [frameId for representedFrameIds in represents for frameId in representedFrameIds])
+        self.represents[:self.count] = [None] * self.count
+        self.packetIndex += 1
+        self.count = 0
+
+    def report(self):
+        """
+        Informs the user about the quantization error of the saved packets (if the features are quantized)
+        """
+        if self.packetFormat == 'npz' and self.storage != 'float32':
+            self.errorTracker.report(self.framesFolder, self.storage)
+
+def createPacketBuffer(configs: dict, movieName: str, outputDir: str, modelName: str, packetIndex: int = 1):
+    """
+    Creates the packet buffer saving the extracted features of a movie (recorded in its features index), as configured
 
     Parameters
     ----------
-    model: Model
-        The initialized model for feature extraction
-    framesFolder: str
-        The frames folder address to extract visual features from
-    outputDir: str
-        The visual features directory to save the extracted features
     configs: dict
         The configurations dictionary
-    
+    movieName: str
+        The movie ID to save the packets for
+    outputDir: str
+        The visual features directory to save the packets in
+    modelName: str
+        The name of the feature extraction model
+    packetIndex: int
+        The index of the first packet to be saved (following the existing packets of an incremental extraction)
+
     Returns
     -------
-    framesFolders :list
-        A list of fetched frames folders
+    packetBuffer: PacketBuffer
+        The packet buffer of the movie features
+    """
+    return PacketBuffer(configs['packet_size'], movieName, outputDir, packetIndex, packetFormat=configs.get('packet_format', 'json'),
+                        modelName=modelName, storage=configs.get('feature_storage', 'float32'),
+                        quantizationScale=configs.get('quantization_scale', 'per_vector'), indexed=True)
+
+def selectShotRepresentatives(shotFrames: list, numFrames: int, framesPerShot: int):
+    """
+    Splits each shot of a movie into (at most) the given number of equal parts, and selects the middle frame of each part
+    to represent the frames of the part
+
+    Parameters
+    ----------
+    shotFrames: list
+        The positions of the first frame of each shot, in frame-index order
+    numFrames: int
+        The number of frames of the movie
+    framesPerShot: int
+        The number of representative frames of each shot
+
+    Returns
+    -------
+    representedPositions: dict
+        The positions of the frames represented by each representative frame, by the position of the representative frame
+    """
+    representedPositions = {}
+    if numFrames == 0:
+        return representedPositions
+    # The frames before the first detected shot (e.g., a black opening) form a shot of their own
+    shotStarts = sorted(set([0] + [position for position in shotFrames if 0 < position < numFrames]))
+    for shotStart, shotEnd in zip(shotStarts, shotStarts[1:] + [numFrames]):
+        for shotPart in np.array_split(np.arange(shotStart, shotEnd), min(max(framesPerShot, 1), shotEnd - shotStart)):
+            representedPositions[int(shotPart[len(shotPart) // 2])] = shotPart.tolist()
+    return representedPositions
+
+def modelRunner(models: dict, framesFolder, outputDirs: dict, configs: dict):
+    """
+    Extracts the visual features of the frames of a movie with one or several models, decoding each frame only once
+    (only the frames missing from the features index of each model are extracted, in new packets)
+        - If 'frames_per_shot' is set, the shots of the movie are detected on the pixels of its frames first, and only
+          the representative frames of each shot run through the models (sparse packets record the frames they stand for)
+
+    Parameters
+    ----------
+    models: dict
+        The initialized models for feature extraction, by model name (e.g., {'incp3': model})
+    framesFolder: str
+        The frames folder address to extract visual features from
+    outputDirs: dict
+        The visual features directory to save the extracted features of each model, by model name
+    configs: dict
+        The configurations dictionary
     """
     # Variables
-    packetIndex = 1  # Holds the name of the packet, e.g. Packet0001
-    packetCounter = 0
-    modelInputSize = 0
-    modelPreprocess = None
+    inferenceTime = 0.0
+    inputWaitTime = 0.0
     startTime = time.time()
-    packetSize = configs['packet_size']
     imageTypes = configs['image_formats']
-    totalFrames = len(os.listdir(framesFolder))
-    modelName = configs['feature_extractor_model']
-    remainingFrames = len(os.listdir(framesFolder))
-    frameFeatureDF = pd.DataFrame(columns=['frameId', 'features'])
-    # Prepare the model-specific variables
-    if modelName == 'incp3':
-        # Load Inception-v3 model variables
-        modelInputSize, modelPreprocess = getIncp3Variables()
-    elif modelName == 'vgg19':
-        # Load VGG-19 model variables
-        modelInputSize, modelPreprocess = getVgg19Variables()
+    batchSize = max(configs.get('batch_size', 1), 1)
+    framesPerShot = configs.get('frames_per_shot', 0)
+    movieName = os.path.basename(framesFolder)
+    # Near-duplicate frames dropped by the frame extractor reuse the features of the frame they duplicate (if requested)
+    duplicateFrames = loadDuplicateFrames(framesFolder) if configs.get('expand_duplicates', True) else {}
+    # Open the frames of the movie (saved as files or packed into shards)
+    framesReader = openMovieFrames(framesFolder, imageTypes)
+    # Find the frames each extracted features vector stands for: the frame itself, or the frames of its part of a shot
+    if framesPerShot > 0:
+        shotFrames = detectFrameShotBoundaries(framesReader, configs.get('shot_threshold', 0.65), configs.get('shot_signature_size', 32))
+        representedPositions = selectShotRepresentatives(shotFrames, len(framesReader), framesPerShot)
+        print(f'- Detected {len(shotFrames)} shots in {movieName}, extracting the features of {len(representedPositions)} of its {len(framesReader)} frames ...')
     else:
-        print(f"Feature extraction model '{modelName}' is not supported! Exiting ...")
+        representedPositions = {position: [position] for position in range(len(framesReader))}
+    # (each one followed by its dropped duplicates)
+    representedFrames = {}
+    for position, positions in representedPositions.items():
+        representedFrameIds = [framesReader.frameIds[representedPosition] for representedPosition in positions]
+        representedFrames[framesReader.frameIds[position]] = [frameId for representedFrameId in representedFrameIds
+                                                              for frameId in [representedFrameId] + duplicateFrames.get(representedFrameId, [])]
+    # Find the frames of each model whose features (or the ones of the frames they stand for) are not extracted yet
+    featuresIndexes, missingFrames = {}, {}
+    for modelName in models:
+        if modelName not in outputDirs:
+            continue
+        featuresIndex = loadFeaturesIndex(outputDirs[modelName])
+        modelMissingFrames = set(frameId for frameId, frameRepresentedFrames in representedFrames.items()
+                                 if not featuresIndex['frameIds'].issuperset(frameRepresentedFrames))
+        if not modelMissingFrames:
+            print(f'- Skipping the {modelName} features of {movieName}, as all of its frames are already extracted!')
+            continue
+        if featuresIndex['frameIds']:
+            print(f'- Extracting the {modelName} features of {len(modelMissingFrames)} missing frames of {movieName} ...')
+        featuresIndexes[modelName], missingFrames[modelName] = featuresIndex, modelMissingFrames
+    modelNames = list(missingFrames)
+    if not modelNames:
+        framesReader.close()
+        return
+    # Prepare the model-specific variables
+    modelsVariables = [getModelVariables(modelName) for modelName in modelNames]
+    if None in modelsVariables:
+        framesReader.close()
         return
-    # Loop over the frames in the folder
-    for imageType in imageTypes:
-        for frameFile in glob(f'{framesFolder}/*.{imageType}'):
-            # Variables
-            frameFileName = os.path.basename(frameFile)
-            framesFolder = os.path.basename(os.path.dirname(frameFile))
+    # New packets follow the existing packets of the movie
+    packetBuffers = [createPacketBuffer(configs, movieName, outputDirs[modelName], modelName, featuresIndexes[modelName]['lastPacketIndex'] + 1)
+                     for modelName in modelNames]
+    positions = [position for position, frameId in enumerate(framesReader.frameIds)
+                 if any(frameId in modelMissingFrames for modelMissingFrames in missingFrames.values())]
+    # Loop over the missing frames of the movie in frame-index order, feeding them to the models in batches
+    # (the next batches are loaded and preprocessed in parallel, while the current one runs through the models)
+    waitStartTime = time.perf_counter()
+    for batchFrameIds, batchFramesData in prefetchFrameBatches(framesReader, modelsVariables, batchSize, configs.get('prefetch_workers', 4),
+                                                               configs.get('prefetch_batches', 2), positions):
+        inputWaitTime += time.perf_counter() - waitStartTime
+        for modelName, modelFramesData, packetBuffer in zip(modelNames, batchFramesData, packetBuffers):
+            # Only feed the frames missing for the model
+            modelFrameIds = [frameId for frameId in batchFrameIds if frameId in missingFrames[modelName]]
+            if not modelFrameIds:
+                continue
+            if len(modelFrameIds) < len(batchFrameIds):
+                modelFramesData = [frameData for frameId, frameData in zip(batchFrameIds, modelFramesData) if frameId in missingFrames[modelName]]
             try:
-                # Finding frameId by removing .jpg from the name
-                frameId = ('frame' + frameFile.rsplit('frame', 1)[1])[:-4]
-                # Get the extracted features
-                features = featureExtractor(frameFile, model, modelPreprocess, modelInputSize)
-                # Check the extracted features
-                if features is None:
-                    print(f'- No features extracted! Skipping "{frameFileName}" in "{framesFolder}" ...')
-                    continue
-                # Append rows to dataFrame
-                frameFeatureDF = pd.concat([frameFeatureDF, pd.DataFrame([{'frameId': frameId, 'features': features[0]}])],
-                                           ignore_index=True)
-                packetCounter += 1
-                # Reset the counter only if packetCounter reaches the limit (packetSize) and there is no more frames for process
-                remainingFrames -= 1
-                if ((packetCounter == packetSize) or remainingFrames == 0):
-                    # Save dataFrame as packet in a file
-                    packetManager(packetIndex, frameFeatureDF,
-                                    framesFolder, outputDir)
-                    # Clear dataFrame rows
-                    frameFeatureDF.drop(frameFeatureDF.index, inplace=True)
-                    packetCounter = 0
-                    packetIndex += 1
+                # Get the extracted features of the batch
+                inferenceStartTime = time.perf_counter()
+                batchFeatures = batchFeatureExtractor(modelFramesData, models[modelName], None)
+                inferenceTime += time.perf_counter() - inferenceStartTime
             except Exception as error:
-                print(f'- Error while extracting the features of "{frameFileName}" in "{framesFolder}": {str(error)}')
+                print(f'- Error while extracting the {modelName} features of "{modelFrameIds[0]}" to "{modelFrameIds[-1]}" in "{movieName}": {str(error)}')
                 continue
+            # Buffer the features in the original order, skipping the frames whose features already exist
+            for modelFrameId, features in zip(modelFrameIds, batchFeatures):
+                missingRepresentedFrames = [frameId for frameId in representedFrames[modelFrameId] if frameId not in featuresIndexes[modelName]['frameIds']]
+                if framesPerShot > 0:
+                    # A single row of the sparse packet stands for all the frames of its part of the shot
+                    packetBuffer.append(modelFrameId, features, missingRepresentedFrames)
+                else:
+                    # Each frame, followed by its dropped duplicates
+                    for rowFrameId in missingRepresentedFrames:
+                        packetBuffer.append(rowFrameId, features)
+        waitStartTime = time.perf_counter()
+    framesReader.close()
+    # Inform the user about the extraction process
+    elapsedTime = '{:.2f}'.format(time.time() - startTime)
+    for modelName, packetBuffer in zip(modelNames, packetBuffers):
+        # Save the last (partial) packet
+        packetBuffer.flush()
+        print(
+            f'- Extracted {packetBuffer.totalFeatures} {modelName} features ({packetBuffer.packetIndex - packetBuffer.firstPacketIndex} packets) of "{movieName}" in {elapsedTime} seconds!')
+        packetBuffer.report()
+    print(f'--- Inference took {inferenceTime:.2f} seconds, while waiting {inputWaitTime:.2f} seconds for its input frames')
+
+def videoRunner(models: dict, videoFile: str, outputDirs: dict, configs: dict):
+    """
+    Extracts the visual features of a movie video in a single pass with one or several models, feeding the decoded
+    frames directly to the models (the frames are never written to the disk)
+        - Only the frames missing from the features index of each model run through the model, in new packets
+        - Once the whole video is processed, the features index is marked as completed (skipping the video next time)
+
+    Parameters
+    ----------
+    models: dict
+        The initialized models for feature extraction, by model name (e.g., {'incp3': model})
+    videoFile: str
+        The movie video file address
+    outputDirs: dict
+        The visual features directory to save the extracted features of each model, by model name
+    configs: dict
+        The configurations dictionary
+    """
+    # Variables
+    frameCounter = 0
+    startTime = time.time()
+    batchSize = max(configs.get('batch_size', 32), 1)
+    samplingMode = configs.get('sampling_mode', 'grab')
+    movieName = os.path.basename(next(iter(outputDirs.values())))
+    # Skip the models whose features of the whole video are already extracted
+    featuresIndexes = {}
+    for modelName in models:
+        if modelName not in outputDirs:
+            continue
+        featuresIndex = loadFeaturesIndex(outputDirs[modelName])
+        if featuresIndex['completed']:
+            print(f'- Skipping the {modelName} features of {movieName}, as all of its frames are already extracted!')
+            continue
+        featuresIndexes[modelName] = featuresIndex
+    modelNames = list(featuresIndexes)
+    if not modelNames:
+        return
+    # Prepare the model-specific variables
+    modelsVariables = [getModelVariables(modelName) for modelName in modelNames]
+    if None in modelsVariables:
+        return
+    # New packets follow the existing packets of the movie
+    packetBuffers = [createPacketBuffer(configs, movieName, outputDirs[modelName], modelName, featuresIndexes[modelName]['lastPacketIndex'] + 1)
+                     for modelName in modelNames]
+    try:
+        # Capturing video
+        capturedVideo = cv.VideoCapture(videoFile)
+        frameRate, frequency, framePickingRate = getFramePickingRate(capturedVideo, configs['frequency'])
+        print(f'- Extracting features of {movieName} with the frequency of {frequency} fps (frame picking rate: {framePickingRate}) ...')
+        sampledFrames = sampleVideoFrames(capturedVideo, framePickingRate, samplingMode)
+        isFinished = False
+        while not isFinished:
+            # Collect a batch of sampled frames missing for each model, prepared in memory as the inputs of the model
+            batchCounter = 0
+            frameIds, framesData = [[] for _ in modelNames], [[] for _ in modelNames]
+            for frameIndex, frame in sampledFrames:
+                # Frame identifiers match the ones of the frame extractor: frame1 --> frame0000001
+                frameId = 'frame{0:07d}'.format(frameCounter)
+                for modelName, modelFrameIds, modelFramesData, (modelInputSize, _) in zip(modelNames, frameIds, framesData, modelsVariables):
+                    if frameId not in featuresIndexes[modelName]['frameIds']:
+                        modelFrameIds.append(frameId)
+                        modelFramesData.append(prepareVideoFrame(frame, modelInputSize))
+                frameCounter += 1
+                batchCounter += 1
+                if batchCounter == batchSize:
+                    break
+            else:
+                isFinished = True
+            # Get the extracted features of the batch (full packets are saved as they fill up)
+            for modelName, modelFrameIds, modelFramesData, (_, modelPreprocess), packetBuffer in zip(modelNames, frameIds, framesData, modelsVariables, packetBuffers):
+                if not modelFrameIds:
+                    continue
+                batchFeatures = batchFeatureExtractor(modelFramesData, models[modelName], modelPreprocess)
+                for frameId, features in zip(modelFrameIds, batchFeatures):
+                    packetBuffer.append(frameId, features)
+            # Showing progress every 1000 frames (i.e., when the batch crosses a multiple of 1000)
+            if frameCounter > 0 and frameCounter % 1000 < batchCounter:
+                elapsedTime = '{:.2f}'.format(time.time() - startTime)
+                print(f'--- Extracted the features of {frameCounter} frames of {movieName} so far (took {elapsedTime} seconds) ...')
+        capturedVideo.release()
+        # Save the last (partial) packets, and mark the features of the video as completed
+        for modelName, packetBuffer in zip(modelNames, packetBuffers):
+            packetBuffer.flush()
+            if packetBuffer.failedPackets == 0:
+                appendFeaturesIndex(outputDirs[modelName], 'completed', [])
+    except cv.error as openCVError:
+        print(f'- Error while processing the video frames of "{movieName}": {str(openCVError)}')
+    except Exception as otherError:
+        print(f'- Error while extracting the features of "{movieName}": {str(otherError)}')
     # Inform the user about the extraction process
     elapsedTime = '{:.2f}'.format(time.time() - startTime)
-    print(
-        f'- Extracted {totalFrames} features ({packetIndex-1} packets) of "{framesFolder}" in {elapsedTime} seconds!')
\ No newline at end of file
+    for modelName, packetBuffer in zip(modelNames, packetBuffers):
+        print(
+            f'- Extracted {packetBuffer.totalFeatures} {modelName} features ({packetBuffer.packetIndex - packetBuffer.firstPacketIndex} packets) of "{movieName}" in {elapsedTime} seconds!')
+        packetBuffer.report()
@@ -0,0 +1,212 @@
+import os
+import time
+from glob import glob
+from movifex.pipelines.frames.utils import initMovieVideos
+from movifex.pipelines.frames.frameManifest import writeJsonAtomically, loadJsonIfExists, isFramesFolderCompleted
+from movifex.pipelines.visual_features.utils import initMovieFramesFolders, getFeatureExtractorModelNames
+from movifex.pipelines.visual_features.featureExtractor import initFeatureExtractorModels, extractMovieFeatures, extractMovieFeaturesFromVideos
+
+# Supported job types: feature extraction from extracted frames folders, or directly from video files
+JOB_TYPES = ['frames', 'videos']
+
+def initJobsFolders(jobsDir: str):
+    """
+    Creates the folders of the job directory, one per job state
+
+    Parameters
+    ----------
+    jobsDir: str
+        The job directory watched by the worker
+
+    Returns
+    -------
+    jobsFolders: dict
+        The folder of each job state ('pending', 'running', 'done' and 'failed')
+    """
+    jobsFolders = {state: os.path.join(jobsDir, state) for state in ['pending', 'running', 'done', 'failed']}
+    for jobsFolder in jobsFolders.values():
+        os.makedirs(jobsFolder, exist_ok=True)
+    return jobsFolders
+
+def submitFeatureExtractionJob(workerConfigs: dict, jobType: str, paths: list):
+    """
+    Submits a feature extraction job to the worker watching the job directory
+
+    Parameters
+    ----------
+    workerConfigs: dict
+        The configurations dictionary of the worker
+    jobType: str
+        The type of the job (pick from ['frames', 'videos'])
+    paths: list
+        The frames folders ('frames' jobs) or the video files ('videos' jobs) to extract the features of
+
+    Returns
+    -------
+    jobFile: str
+        The path of the submitted job file (None if the job is not valid)
+    """
+    if jobType not in JOB_TYPES:
+        print(f"Job type '{jobType}' is not supported (pick from {JOB_TYPES})! Exiting ...")
+        return None
+    if not paths:
+        print("No movies to submit a job for! Exiting ...")
+        return None
+    jobsFolders = initJobsFolders(workerConfigs['jobs_path'])
+    submitTime = time.time()
+    # Job names sort in submission order (the worker handles the oldest job first)
+    jobName = 'job_{0}_{1}'.format(time.strftime('%Y%m%d%H%M%S', time.localtime(submitTime)), '{0:06d}'.format(int(submitTime * 1e6) % 1000000))
+    jobFile = os.path.join(jobsFolders['pending'], f'{jobName}.json')
+    writeJsonAtomically(jobFile, {'name': jobName, 'type': jobType, 'paths': [os.path.normpath(path) for path in paths],
+                                  'submitted': submitTime})
+    print(f"- Submitted the job '{jobName}' with {len(paths)} {jobType} to '{workerConfigs['jobs_path']}' ...")
+    return jobFile
+
+def submitPipelineJob(workerConfigs: dict, framesConfigs: dict, videosConfigs: dict):
+    """
+    Submits a job with the movies found by the frames (or videos) visual feature extractor pipeline
+
+    Parameters
+    ----------
+    workerConfigs: dict
+        The configurations dictionary of the worker
+    framesConfigs: dict
+        The configurations dictionary of the movie frames visual feature extractor pipeline
+    videosConfigs: dict
+        The configurations dictionary of the movie videos visual feature extractor pipeline
+
+    Returns
+    -------
+    jobFile: str
+        The path of the submitted job file (None if no job is submitted)
+    """
+    jobType = workerConfigs.get('submit_job_type', 'frames')
+    # Submit the given paths, or all the movies found by the pipeline (the already extracted ones are skipped by the worker)
+    paths = workerConfigs.get('submit_paths') or []
+    if not paths:
+        paths = (initMovieFramesFolders(framesConfigs) if jobType == 'frames' else initMovieVideos(videosConfigs)) or []
+    return submitFeatureExtractionJob(workerConfigs, jobType, paths)
+
+def claimNextJob(jobsFolders: dict):
+    """
+    Claims the oldest pending job, by moving it to the running jobs folder
+
+    Parameters
+    ----------
+    jobsFolders: dict
+        The folder of each job state
+
+    Returns
+    -------
+    jobFile: str
+        The path of the claimed job file (None if there is no pending job)
+    queueDepth: int
+        The number of jobs still pending after the claimed one
+    """
+    pendingJobs = sorted(glob(os.path.join(jobsFolders['pending'], '*.json')))
+    for index, pendingJob in enumerate(pendingJobs):
+        runningJob = os.path.join(jobsFolders['running'], os.path.basename(pendingJob))
+        try:
+            os.replace(pendingJob, runningJob)
+        except OSError:
+            # Claimed by another worker in the meantime
+            continue
+        return runningJob, len(pendingJobs) - index - 1
+    return None, 0
+
+def runFeatureExtractionJob(job: dict, models: dict, framesConfigs: dict, videosConfigs: dict):
+    """
+    Runs a feature extraction job with the already loaded models
+        - The frames folders whose frame extraction is not completed (or which do not exist) are skipped, and recorded
+          in the 'skippedPaths' of the job
+
+    Parameters
+    ----------
+    job: dict
+        The job, containing the 'type' and 'paths' keys
+    models: dict
+        The loaded models by model name
+    framesConfigs: dict
+        The configurations dictionary of the movie frames visual feature extractor pipeline
+    videosConfigs: dict
+        The configurations dictionary of the movie videos visual feature extractor pipeline
+    """
+    if job['type'] == 'frames':
+        # Skip the movies whose frame extraction is interrupted (or still running), as the pipeline does
+        framesFolders = [path for path in job['paths'] if os.path.isdir(path) and isFramesFolderCompleted(path)]
+        job['skippedPaths'] = [path for path in job['paths'] if path not in framesFolders]
+        for skippedPath in job['skippedPaths']:
+            print(f"- Skipping '{skippedPath}', as it does not exist or its frame extraction is not completed!")
+        if framesFolders:
+            extractMovieFeatures(framesConfigs, framesFolders, models)
+    elif job['type'] == 'videos':
+        # The video jobs are served by the models of the worker
+        extractMovieFeaturesFromVideos(dict(videosConfigs, feature_extractor_model=framesConfigs['feature_extractor_model']),
+                                       job['paths'], models)
+    else:
+        raise ValueError(f"job type '{job['type']}' is not supported")
+
+def runFeatureExtractionWorker(workerConfigs: dict, framesConfigs: dict, videosConfigs: dict):
+    """
+    Runs a long-lived feature extraction worker that keeps the models loaded and handles the jobs submitted to its
+    job directory, until a 'stop' file is created in the job directory (or it is interrupted)
+
+    Parameters
+    ----------
+    workerConfigs: dict
+        The configurations dictionary of the worker
+    framesConfigs: dict
+        The configurations dictionary of the movie frames visual feature extractor pipeline (models and options)
+    videosConfigs: dict
+        The configurations dictionary of the movie videos visual feature extractor pipeline
+    """
+    print("Starting the feature extraction worker ...")
+    # Variables
+    jobsCounter = 0
+    jobsDir = workerConfigs['jobs_path']
+    pollInterval = workerConfigs.get('poll_interval', 1.0)
+    stopFile = os.path.join(jobsDir, 'stop')
+    jobsFolders = initJobsFolders(jobsDir)
+    # Requeue the jobs left running by an interrupted worker
+    for runningJob in glob(os.path.join(jobsFolders['running'], '*.json')):
+        os.replace(runningJob, os.path.join(jobsFolders['pending'], os.path.basename(runningJob)))
+    # Load the models once, for all the jobs
+    startTime = time.time()
+    models = initFeatureExtractorModels(getFeatureExtractorModelNames(framesConfigs), framesConfigs)
+    if not models:
+        return
+    print(f"- Loaded the models {list(models)} in {time.time() - startTime:.2f} seconds. Watching '{jobsDir}' for jobs ...")
+    try:
+        while not os.path.exists(stopFile):
+            jobFile, queueDepth = claimNextJob(jobsFolders)
+            if jobFile is None:
+                time.sleep(pollInterval)
+                continue
+            job = loadJsonIfExists(jobFile) or {}
+            jobName = job.get('name', os.path.splitext(os.path.basename(jobFile))[0])
+            print(f"- Running the job '{jobName}' ({queueDepth} jobs pending) ...")
+            # Run the job, isolating its failures from the worker
+            jobStartTime = time.time()
+            try:
+                runFeatureExtractionJob(job, models, framesConfigs, videosConfigs)
+                jobState = 'done'
+            except Exception as error:
+                print(f"- Error while running the job '{jobName}': {str(error)}")
+                job['error'] = str(error)
+                jobState = 'failed'
+            jobEndTime = time.time()
+            # Record the per-job latency (from the submission) and the processing time
+            job['queueDepth'] = queueDepth
+            job['processingTime'] = round(jobEndTime - jobStartTime, 3)
+            job['latency'] = round(jobEndTime - job.get('submitted', jobStartTime), 3)
+            writeJsonAtomically(os.path.join(jobsFolders[jobState], os.path.basename(jobFile)), job)
+            os.remove(jobFile)
+            jobsCounter += 1
+            print(f"- Job '{jobName}' {jobState} in {job['processingTime']:.2f} seconds (latency: {job['latency']:.2f} seconds, "
+                  f"{len(glob(os.path.join(jobsFolders['pending'], '*.json')))} jobs pending)")
+    except KeyboardInterrupt:
+        print("- The worker is interrupted!")
+    # Remove the stop signal, so that the next worker does not stop immediately
+    if os.path.exists(stopFile):
+        os.remove(stopFile)
+    print(f"- Feature extraction worker stopped after {jobsCounter} jobs!")
@@ -7,10 +7,12 @@ from movifex.pipelines.frames.frameExtractor import extractMovieFrames
 from movifex.pipelines.visual_features.utils import initMovieFramesFolders
 from movifex.pipelines.shots.utils import initFramesFoldersForShotDetection
 from movifex.pipelines.shots.utils import initFeaturesFoldersForShotDetection
-from movifex.pipelines.visual_features.featureExtractor import extractMovieFeatures
+from movifex.pipelines.visual_features.featureExtractor import extractMovieFeatures, extractMovieFeaturesFromVideos
 from movifex.pipelines.downloaders.movieTrailerDownloader import downloadMovieTrailers
+from movifex.pipelines.visual_features.packets import convertJsonPackets
 from movifex.pipelines.visual_features.featureAggregator import aggregateMovieFeatures
-from movifex.pipelines.shots.shotDetection import extractShotsFromMovieFrames, extractShotsFromMovieFeatures
+from movifex.pipelines.visual_features.worker import runFeatureExtractionWorker, submitPipelineJob
+from movifex.pipelines.shots.shotDetection import extractShotsFromMovieFrames, extractShotsFromMovieFeatures, sweepShotThresholds
 
 def runTrailerDownloader(configs: dict, datasetInfo: dict):
     """
@@ -70,6 +72,23 @@ def runMoviesFramesFeatureExtractor(configs: dict):
     # Extract visual features from the fetched frames
     extractMovieFeatures(configs, fetchedMovieFramesPaths)
 
+def runMoviesVideoFeatureExtractor(configs: dict):
+    """
+    Runs the feature extractor pipeline directly from the movie videos, without saving their frames
+
+    Parameters
+    ----------
+    configs :dict
+        The configurations dictionary
+    """
+    print("Running the movies videos visual feature extractor pipeline ...")
+    # Pre-check the input directory
+    fetchedMoviesPaths = initMovieVideos(configs)
+    if not fetchedMoviesPaths:
+        return
+    # Extract visual features from the decoded frames of the fetched movies
+    extractMovieFeaturesFromVideos(configs, fetchedMoviesPaths)
+
 def runShotDetectionFromFrames(configs: dict):
     """
     Runs the shot detection pipeline from the movie frames
@@ -104,6 +123,23 @@ def runShotDetectionFromFeatures(configs: dict):
     # Extract shots from the fetched features
     extractShotsFromMovieFeatures(configs, movieFeaturesPaths)
 
+def runShotThresholdSweep(configs: dict):
+    """
+    Runs the shot boundaries detection threshold sweep on the extracted movie features
+
+    Parameters
+    ----------
+    configs :dict
+        The configurations dictionary
+    """
+    print("Running the shot detection threshold sweep on the extracted movie features ...")
+    # Pre-check the input directory
+    movieFeaturesPaths = initFeaturesFoldersForShotDetection(configs)
+    if not movieFeaturesPaths:
+        return
+    # Report the number of shots of the fetched features per threshold
+    sweepShotThresholds(configs, movieFeaturesPaths)
+
 def runAggFeatures(configs: dict):
     """
     Runs the feature aggregation pipeline
@@ -115,4 +151,49 @@ def runAggFeatures(configs: dict):
     """
     print("Running the feature aggregation pipeline ...")
     # Aggregate features from the given set of extracted movie features
-    aggregateMovieFeatures(configs)
\ No newline at end of file
+    aggregateMovieFeatures(configs)
+
+def runPacketConverter(configs: dict):
+    """
+    Runs the pipeline converting the JSON feature packets into binary packets
+
+    Parameters
+    ----------
+    configs: dict
+        The configurations dictionary
+    """
+    print("Running the feature packets converter pipeline ...")
+    # Convert the JSON packets of the given set of extracted movie features
+    convertJsonPackets(configs)
+
+def runFeatureWorker(configs: dict, framesConfigs: dict, videosConfigs: dict):
+    """
+    Runs the warm feature extraction worker, handling the submitted jobs with the models loaded once
+
+    Parameters
+    ----------
+    configs: dict
+        The configurations dictionary of the worker
+    framesConfigs: dict
+        The configurations dictionary of the movie frames visual feature extractor pipeline
+    videosConfigs: dict
+        The configurations dictionary of the movie videos visual feature extractor pipeline
+    """
+    print("Running the feature extraction worker pipeline ...")
+    runFeatureExtractionWorker(configs, framesConfigs, videosConfigs)
+
+def runFeatureJobSubmitter(configs: dict, framesConfigs: dict, videosConfigs: dict):
+    """
+    Submits a feature extraction job to the warm feature extraction worker
+
+    Parameters
+    ----------
+    configs: dict
+        The configurations dictionary of the worker
+    framesConfigs: dict
+        The configurations dictionary of the movie frames visual feature extractor pipeline
+    videosConfigs: dict
+        The configurations dictionary of the movie videos visual feature extractor pipeline
+    """
+    print("Submitting a job to the feature extraction worker ...")
+    submitPipelineJob(configs, framesConfigs, videosConfigs)
\ No newline at end of file
@@ -71,6 +71,24 @@ def loadJsonFromUrl(jsonUrl: str):
     except json.JSONDecodeError as e:
         print(f"- Error parsing JSON data: {e}")
         return None
+
+def loadBytesFromUrl(fileUrl: str):
+    """
+    Load the raw content of a (binary) file from a given URL and return it.
+
+    Parameters:
+        fileUrl (str): The address to load the file content from.
+
+    Returns:
+        bytes: The file content loaded from the URL.
+    """
+    try:
+        response = requests.get(fileUrl)
+        response.raise_for_status()  # Raise an error for bad status codes
+        return response.content
+    except requests.exceptions.RequestException as e:
+        print(f"- Error fetching data from {fileUrl}: {e}\n")
+        return None
     
 def loadJsonFromFilePath(jsonPath: str):
     """